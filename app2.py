@@ -1,17 +1,37 @@
 import streamlit as st
+import hashlib
 import json
 import pandas as pd
-from PIL import Image
+from PIL import Image, ImageOps
 import io
 import datetime 
 import numpy as np
-import plotly.express as px
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from google import genai
 from google.genai.types import HarmCategory, HarmBlockThreshold 
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from pydantic import BaseModel
 import time 
 from fpdf import FPDF # 📢 PDF 라이브러리 임포트 (fpdf2 설치 필요)
 
+# orjson (C extension) parses the Gemini receipt JSON much faster than the stdlib; fall back if it is not installed.
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# pyarrow (installed with streamlit) writes CSV in C; the ledger export falls back to pandas without it.
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+
 # ----------------------------------------------------------------------
 # 📌 0. Currency Conversion Setup & Globals
 # ----------------------------------------------------------------------
@@ -26,8 +46,21 @@ except KeyError:
     st.error("❌ Please set 'GEMINI_API_KEY', 'EXCHANGE_RATE_API_KEY', and 'KAKAO_REST_API_KEY' in Streamlit Secrets.")
     st.stop()
 
-# Initialize GenAI client
-client = genai.Client(api_key=API_KEY)
+# Initialize GenAI client (held across reruns so its HTTP connection pool is reused)
+@st.cache_resource
+def get_genai_client(api_key: str) -> genai.Client:
+    return genai.Client(api_key=api_key)
+
+client = get_genai_client(API_KEY)
+
+# Shared HTTP session for Kakao / ExchangeRate-API calls (keep-alive connections are reused across reruns)
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+    session.mount("https://", adapter)
+    return session
 
 # --- 📢 [UPDATED] Geocoding Helper Function (Kakao API 최적화) ---
 @st.cache_data(ttl=datetime.timedelta(hours=48))
@@ -46,9 +79,9 @@ def geocode_address(address: str) -> tuple[float, float]:
     params = {"query": address}
 
     try:
-        response = requests.get(url, headers=headers, params=params, timeout=5)
+        response = get_http_session().get(url, headers=headers, params=params, timeout=5)
         response.raise_for_status()
-        data = response.json()
+        data = json_loads(response.content)
         
         if data and data.get('documents'):
             # 첫 번째 검색 결과 사용
@@ -72,14 +105,138 @@ def geocode_address(address: str) -> tuple[float, float]:
     return 37.5665, 126.9780
 
 
+# 💡 Background work (geocoding, receipt analysis): the pool lives in cache_resource so it survives Streamlit reruns.
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=4)
+
+
+def submit_with_ctx(fn, *args) -> Future:
+    """Runs fn(*args) on the shared pool with the current script context attached."""
+    ctx = get_script_run_ctx()
+
+    def _run():
+        # Attach the script context so st.cache_data / st.* calls work inside the worker.
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args)
+
+    return get_executor().submit(_run)
+
+
+def geocode_address_async(address: str) -> Future:
+    """Starts geocode_address on the shared pool so the Kakao call overlaps with UI rendering."""
+    return submit_with_ctx(geocode_address, address)
+
+
 # 💡 헬퍼 함수: 단일 값을 안전하게 추출하고, 숫자가 아니거나 누락된 경우 0.0을 반환합니다.
-def safe_get_amount(data, key):
-    """단일 값을 안전하게 추출하고, 숫자가 아니거나 누락된 경우 0.0을 반환합니다."""
-    value = data.get(key, 0)
-    # pd.to_numeric을 사용하여 숫자로 변환 시도. 변환 실패 시 NaN 반환.
-    numeric_value = pd.to_numeric(value, errors='coerce')
-    # NaN이면 0.0을 사용하고, 아니면 해당 숫자 값을 사용
-    return numeric_value if not pd.isna(numeric_value) else 0.0
+def safe_get_amount(data, key, default=0.0):
+    """단일 값을 안전하게 추출하고, 숫자가 아니거나 누락된 경우 default(0.0)를 반환합니다."""
+    value = data.get(key, default)
+    # JSON 디코더가 이미 숫자로 변환한 경우 바로 반환 (NaN != NaN)
+    if isinstance(value, (int, float)):
+        return float(value) if value == value else default
+    # 문자열 등은 float 변환 시도. 변환 실패 시 default 반환.
+    try:
+        numeric_value = float(value)
+    except (TypeError, ValueError):
+        return default
+    # NaN이면 default를 사용하고, 아니면 해당 숫자 값을 사용
+    return numeric_value if numeric_value == numeric_value else default
+
+# 💡 헬퍼 함수: 세션 상태에 누적되는 아이템 DataFrame의 메모리 사용량을 줄입니다.
+def optimize_df(df: pd.DataFrame) -> pd.DataFrame:
+    """AI Category는 CATEGORY_DTYPE(목록에 없는 값이 있으면 일반 category)로, 나머지 반복 텍스트 컬럼은 'category'로, 수량은 float32로 변환합니다. 금액 컬럼은 KRW 정밀도를 위해 float64로 유지합니다."""
+    cat_cols = [col for col in ['Currency', 'Store'] if col in df.columns]
+    money_cols = [col for col in ['Unit Price', 'Total Spend', 'KRW Total Spend'] if col in df.columns]
+    if 'AI Category' in df.columns:
+        ai_category = df['AI Category']
+        in_vocabulary = (ai_category.isna() | ai_category.isin(ALL_CATEGORIES)).all()
+        df['AI Category'] = ai_category.astype(CATEGORY_DTYPE if in_vocabulary else 'category')
+    if cat_cols:
+        df[cat_cols] = df[cat_cols].astype('category')
+    if money_cols:
+        df[money_cols] = df[money_cols].apply(pd.to_numeric, errors='coerce').astype('float64')
+    if 'Quantity' in df.columns:
+        df['Quantity'] = pd.to_numeric(df['Quantity'], errors='coerce', downcast='float')
+    return df
+
+# 💡 헬퍼 함수: Summary id로 이미 분석된 영수증을 O(1)로 조회합니다.
+def find_summary_by_id(summary_id: str):
+    """해당 id의 Summary dict(없으면 None)를 반환합니다. id 인덱스는 Summary 목록이 바뀔 때만 다시 만듭니다."""
+    summaries = st.session_state.all_receipts_summary
+    index = st.session_state.get('summary_id_index')
+    if index is None or index[0] is not summaries or index[1] != len(summaries):
+        index = (summaries, len(summaries), {s.get('id'): s for s in summaries})
+        st.session_state.summary_id_index = index
+    return index[2].get(summary_id)
+
+# 💡 헬퍼 함수: Summary 목록을 DataFrame으로 변환하되, 영수증이 추가되거나 기록이 초기화될 때만 다시 만듭니다.
+def get_summary_df() -> pd.DataFrame:
+    """세션 상태에 저장된 pd.DataFrame(all_receipts_summary)의 얕은 복사본을 반환합니다."""
+    summaries = st.session_state.all_receipts_summary
+    cache = st.session_state.get('summary_df_cache')
+    if cache is None or cache[0] is not summaries or cache[1] != len(summaries):
+        cache = (summaries, len(summaries), pd.DataFrame(summaries))
+        st.session_state.summary_df_cache = cache
+    return cache[2].copy(deep=False)
+
+# 💡 헬퍼 함수: 누적 기록에서 계산한 값을 영수증이 추가되거나 기록이 초기화될 때까지 재사용합니다.
+def ledger_memo(cache_key: str, build):
+    """현재 all_receipts_items 목록에 대해 build() 결과를 st.session_state[cache_key]에 저장해 반환합니다."""
+    items = st.session_state.all_receipts_items
+    cache = st.session_state.get(cache_key)
+    if cache is None or cache[0] is not items or cache[1] != len(items):
+        cache = (items, len(items), build())
+        st.session_state[cache_key] = cache
+    return cache[2]
+
+# 💡 헬퍼 함수: 누적된 아이템 DataFrame을 변경이 있을 때만 다시 합칩니다.
+def get_all_items_df() -> pd.DataFrame:
+    """all_receipts_items를 합친 DataFrame을 반환합니다. 영수증이 추가되거나 기록이 초기화될 때까지 세션 상태에 저장해 재사용합니다."""
+    items = st.session_state.all_receipts_items
+    cache = st.session_state.get('all_items_df_cache')
+    if cache is not None and cache[0] is items and 0 < cache[1] < len(items):
+        # 영수증이 추가만 된 경우: 저장된 DataFrame에 새 영수증만 이어 붙임 (업로드당 concat 1회)
+        st.session_state.all_items_df_cache = (items, len(items), optimize_df(pd.concat([cache[2], *items[cache[1]:]], ignore_index=True)))
+    all_items_df = ledger_memo('all_items_df_cache', lambda: optimize_df(pd.concat(items, ignore_index=True)))
+    # 얕은 복사: 호출하는 쪽에서 컬럼을 추가해도 저장된 DataFrame은 변경되지 않음
+    return all_items_df.copy(deep=False)
+
+# 💡 헬퍼 함수: AI Category별 누적 KRW 합계를 새로 추가된 영수증만 반영해 갱신합니다.
+def get_category_totals() -> dict:
+    """
+    {카테고리: KRW 합계}를 반환합니다. 전체 기록을 다시 groupby하지 않고 추가된 영수증만 한 번씩 더합니다.
+    장부의 DataFrame은 제자리에서 수정되지 않는다고 가정합니다. 수정된 영수증은 교체해야 다시 집계됩니다.
+    """
+    items = st.session_state.all_receipts_items
+    cache = st.session_state.get('category_totals_cache')
+    if cache is None or cache[0] is not items or cache[1] > len(items):
+        cache = (items, 0, {})
+    totals = dict(cache[2])
+    for item_df in items[cache[1]:]:
+        if 'KRW Total Spend' in item_df.columns:
+            krw_spend = item_df['KRW Total Spend'].to_numpy()
+        else:
+            krw_spend = vec_to_krw(item_df['Total Spend'], item_df['Currency'], EXCHANGE_RATES)
+        for category, spend in zip(item_df['AI Category'].to_numpy(), krw_spend):
+            if category == category and spend == spend:  # groupby와 동일하게 NaN 카테고리와 NaN 금액은 제외
+                totals[str(category)] = totals.get(str(category), 0.0) + float(spend)
+    st.session_state.category_totals_cache = (items, len(items), totals)
+    return totals
+
+# 💡 헬퍼 함수: CSV 변환 (호출부의 ledger_memo가 장부 변경 시에만 다시 계산)
+def convert_df_to_csv(df):
+    if pa is not None:
+        try:
+            buf = io.BytesIO()
+            buf.write(b"\xef\xbb\xbf")  # UTF-8 BOM so Excel reads Korean text correctly
+            # 카테고리 컬럼은 문자열로 변환해 pandas 경로와 같은 값이 기록되도록 합니다.
+            plain_df = df.astype({col: 'string' for col in df.select_dtypes('category').columns})
+            pacsv.write_csv(pa.Table.from_pandas(plain_df, preserve_index=False), buf)
+            return buf.getvalue()
+        except (pa.ArrowException, TypeError, ValueError):
+            pass
+    return df.to_csv(index=False).encode('utf-8-sig')
 
 # 💡 헬퍼 함수: 업로드된 아이템 데이터프레임에서 Summary 데이터를 재구성하는 헬퍼 함수
 def regenerate_summary_data(item_df: pd.DataFrame) -> dict:
@@ -87,7 +244,7 @@ def regenerate_summary_data(item_df: pd.DataFrame) -> dict:
     
     # 🚨 필수 컬럼 존재 여부 확인 (내보낸 CSV 파일 기준)
     required_cols = ['Item Name', 'AI Category', 'KRW Total Spend']
-    if not all(col in item_df.columns for col in required_cols):
+    if set(required_cols).difference(item_df.columns):
         return None
 
     # KRW Total Spend 합계 = Total (KRW)
@@ -100,7 +257,7 @@ def regenerate_summary_data(item_df: pd.DataFrame) -> dict:
     lat, lon = geocode_address("Imported Location")
     
     summary_data = {
-        'id': f"imported-{pd.Timestamp.now().timestamp()}",
+        'id': f"imported-{time.time_ns()}",
         'filename': 'Imported CSV',
         'Store': 'Imported Record',
         'Total': final_total_krw, 
@@ -118,24 +275,7 @@ def regenerate_summary_data(item_df: pd.DataFrame) -> dict:
     }
     return summary_data
 
-# 💡 헬퍼 함수: Level 3 카테고리를 최종 4가지 심리 카테고리 중 하나에 매핑하는 역할을 합니다.
-def get_psychological_category(sub_category: str) -> str:
-    """ Maps a detailed AI sub-category to one of the four main psychological categories. """
-    nature = SPENDING_NATURE.get(sub_category, 'Loss_Unclassified')
-    
-    if nature in ['Investment_Asset']:
-        return PSYCHOLOGICAL_CATEGORIES[0] # Investment / Asset
-    elif nature in ['Consumption_Experience', 'Consumption_Planned']:
-        return PSYCHOLOGICAL_CATEGORIES[1] # Experience / High-Value Consumption
-    elif nature in ['Impulse_Habitual', 'Impulse_Convenience', 'Loss_Inefficiency', 'Loss_Unclassified']:
-        return PSYCHOLOGICAL_CATEGORIES[2] # Habit / Impulse Loss
-    elif nature in ['Fixed_Essential']:
-        return PSYCHOLOGICAL_CATEGORIES[3] # Fixed / Essential Cost
-    else:
-        return PSYCHOLOGICAL_CATEGORIES[2] # Default to Impulse/Loss if unknown
-
-
-@st.cache_data(ttl=datetime.timedelta(hours=24))
+@st.cache_data(ttl=datetime.timedelta(hours=1))  # ExchangeRate-API refreshes hourly
 def get_exchange_rates():
     """
     Fetches real-time exchange rates using ExchangeRate-API (USD Base).
@@ -148,9 +288,9 @@ def get_exchange_rates():
     exchange_rates = {'KRW': 1.0} 
 
     try:
-        response = requests.get(url, timeout=10)
+        response = get_http_session().get(url, timeout=10)
         response.raise_for_status() 
-        data = response.json()
+        data = json_loads(response.content)
         conversion_rates = data.get('conversion_rates', {})
         
         # 1. KRW Rate (USD -> KRW) 추출
@@ -199,6 +339,15 @@ def convert_to_krw(amount: float, currency: str, rates: dict) -> float:
         
     return amount * rate
 
+
+# 💡 Helper function: Vectorized convert_to_krw for whole columns (same fallback rules)
+def vec_to_krw(amounts: pd.Series, currencies: pd.Series, rates: dict) -> np.ndarray:
+    """ Converts a column of amounts to KRW in one NumPy multiply instead of a per-row apply. """
+    rate_series = currencies.astype(str).str.upper().str.strip().map(rates).fillna(rates.get('KRW', 1.0))
+    rate_array = rate_series.to_numpy(dtype=np.float64)
+    rate_array = np.where(rate_array == 0, rates.get('USD', 1300), rate_array)
+    return pd.to_numeric(amounts, errors='coerce').fillna(0).to_numpy(dtype=np.float64) * rate_array
+
 # Global Categories (Internal classification names remain Korean for consistency with AI analysis prompt)
 # 📢 [MODIFIED] Household Goods 카테고리 세분화
 ALL_CATEGORIES = [
@@ -211,14 +360,7 @@ ALL_CATEGORIES = [
     "Movies & Shows", "Travel & Accommodation", "Games & Digital Goods", 
     "Events & Gifts", "Fees & Penalties", "Rent & Mortgage", "Unclassified"
 ]
-
-# The four main categories for the final analysis report.
-PSYCHOLOGICAL_CATEGORIES = [
-    "Investment / Asset", 
-    "Experience / High-Value Consumption", 
-    "Habit / Impulse Loss", 
-    "Fixed / Essential Cost"
-]
+CATEGORY_DTYPE = pd.CategoricalDtype(categories=ALL_CATEGORIES)  # Shared dtype keeps 'AI Category' categorical across pd.concat
 
 # --- New Global Variable for Psychological Analysis ---
 # Maps the detailed sub-category to its primary psychological spending nature.
@@ -285,6 +427,15 @@ def get_psychological_category(sub_category: str) -> str:
         return PSYCHOLOGICAL_CATEGORIES[2] # Default to Impulse/Loss if unknown
 
 
+# Sub-category -> psychological category lookup, folded once at import so per-row work is a dict lookup.
+SUB_TO_PSYCH = {sub: get_psychological_category(sub) for sub in SPENDING_NATURE}
+
+
+def map_psychological_category(sub_categories: pd.Series) -> pd.Series:
+    """ Vectorized get_psychological_category(): unknown sub-categories fall back to Habit / Impulse Loss. """
+    return sub_categories.map(SUB_TO_PSYCH).astype(object).fillna(PSYCHOLOGICAL_CATEGORIES[2])
+
+
 def get_category_guide():
     # 💡 이 함수도 새로운 카테고리에 맞춰 영어로 업데이트합니다.
     guide = ""
@@ -309,6 +460,12 @@ if 'all_receipts_summary' not in st.session_state:
     st.session_state.all_receipts_summary = []
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
+if 'pending_analyses' not in st.session_state:
+    st.session_state.pending_analyses = {}
+if 'receipt_results' not in st.session_state:
+    st.session_state.receipt_results = {}  # file_id -> analysis JSON awaiting "Save to Ledger"
+if 'receipt_edits' not in st.session_state:
+    st.session_state.receipt_edits = {}  # file_id -> edited AI Category list for that review
 
 
 st.set_page_config(
@@ -345,17 +502,12 @@ st.markdown("---")
 EXCHANGE_RATES = get_exchange_rates()
 
 
-# --- 1. Gemini Analysis Function (Translated Prompt) ---
-def analyze_receipt_with_gemini(_image: Image.Image):
-    """
-    Calls the Gemini model to extract data and categorize items from a receipt image.
-    """
-    
-    prompt_template = """
+# 📢 Static receipt-analysis prompt, built once at import instead of on every call
+ANALYZE_RECEIPT_PROMPT = """
     You are an expert in receipt analysis and ledger recording.
     Analyze the following items from the receipt image and **you must extract them in JSON format**.
     
-    **CRITICAL INSTRUCTION:** The response must only contain the **JSON code block wrapped in backticks (```json)**. Do not include any explanations, greetings, or additional text outside the JSON code block.
+    **CRITICAL INSTRUCTION:** The response must only contain the JSON object. Do not include any explanations, greetings, or additional text.
     
     1. store_name: Store Name (text)
     2. date: Date (YYYY-MM-DD format). **If not found, use YYYY-MM-DD format based on today's date.**
@@ -377,7 +529,6 @@ def analyze_receipt_with_gemini(_image: Image.Image):
     - **IMPULSE / LOSS:** Casual Dining, Coffee & Beverages, Alcohol & Bars, Games & Digital Goods, Taxi Convenience, Fees & Penalties, Unclassified
         
     JSON Schema:
-    ```json
     {
       "store_name": "...",
       "date": "...",
@@ -392,32 +543,139 @@ def analyze_receipt_with_gemini(_image: Image.Image):
       ]
     }
     """
-    
-    try:
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=[prompt_template, _image],
-            config=genai.types.GenerateContentConfig(
-                safety_settings=[
-                    {"category": HarmCategory.HARM_CATEGORY_HARASSMENT, "threshold": HarmBlockThreshold.BLOCK_NONE},
-                ]
-            )
-        )
-        return response.text
-    
-    except Exception as e:
-        st.error(f"Gemini API call failed: {e}")
-        return None
 
-# --- 2. AI Analysis Report Generation Function ---
-def generate_ai_analysis(summary_df: pd.DataFrame, store_name: str, total_amount: float, currency_unit: str, detailed_items_text: str):
+
+# 📢 Structured output schema: Gemini returns raw JSON matching this shape (no markdown fence to strip)
+class ReceiptItem(BaseModel):
+    name: str
+    price: float
+    quantity: float
+    category: str
+
+
+class ReceiptAnalysis(BaseModel):
+    store_name: str
+    date: str
+    store_location: str
+    total_amount: float
+    tax_amount: float
+    tip_amount: float
+    discount_amount: float
+    currency_unit: str
+    items: list[ReceiptItem]
+
+
+# 💡 Helper function: Shrinks phone photos before upload (OCR accuracy plateaus well below 12 MP)
+RECEIPT_MAX_EDGE = 1600
+
+def prepare_receipt_image(image_bytes: bytes) -> genai.types.Part:
+    """Resizes the receipt to a max edge of RECEIPT_MAX_EDGE px and re-encodes it as JPEG (quality 85)."""
+    image = Image.open(io.BytesIO(image_bytes))
+    if max(image.size) <= RECEIPT_MAX_EDGE and image.format == 'JPEG':
+        # Already small and JPEG: send the original bytes untouched
+        return genai.types.Part.from_bytes(data=image_bytes, mime_type='image/jpeg')
+    image = ImageOps.exif_transpose(image)  # Re-encoding drops EXIF, so bake the camera orientation into the pixels
+    image.thumbnail((RECEIPT_MAX_EDGE, RECEIPT_MAX_EDGE), Image.Resampling.LANCZOS)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    buf = io.BytesIO()
+    image.save(buf, format='JPEG', quality=85, optimize=True)
+    return genai.types.Part.from_bytes(data=buf.getvalue(), mime_type='image/jpeg')
+
+
+# 💡 헬퍼 함수: 업로드 영역에 표시할 작은 미리보기를 만듭니다. 이미지당 한 번만 디코딩합니다.
+RECEIPT_PREVIEW_EDGE = 800
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def make_receipt_preview(image_digest: str, _image_bytes: bytes) -> bytes:
+    """화면 표시용 영수증 JPEG 썸네일(최대 변 RECEIPT_PREVIEW_EDGE px)을 반환합니다."""
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(_image_bytes)))
+    image.thumbnail((RECEIPT_PREVIEW_EDGE, RECEIPT_PREVIEW_EDGE), Image.Resampling.LANCZOS)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    buf = io.BytesIO()
+    image.save(buf, format='JPEG', quality=85)
+    return buf.getvalue()
+
+
+# --- 1. Gemini Analysis Function (Translated Prompt) ---
+@st.cache_data(persist="disk", show_spinner=False)
+def _analyze_receipt_bytes(image_digest: str, _image_bytes: bytes) -> str:
     """
-    Generates an AI analysis report based on aggregated spending data and detailed items.
+    Calls the Gemini model on the raw receipt image and returns the response text.
+    Cached on the BLAKE2b digest of the image bytes (persisted to disk), so a receipt that was
+    already analyzed never hits the API again. Errors are raised, so failures are not cached.
     """
-    # 🌟 추가/수정: summary_df를 문자열로 변환하여 summary_text 변수 정의
-    summary_text = summary_df.to_string(index=False)
+    response = client.models.generate_content(
+        model='gemini-2.5-flash',
+        contents=[ANALYZE_RECEIPT_PROMPT, prepare_receipt_image(_image_bytes)],
+        config=genai.types.GenerateContentConfig(
+            safety_settings=[
+                {"category": HarmCategory.HARM_CATEGORY_HARASSMENT, "threshold": HarmBlockThreshold.BLOCK_NONE},
+            ],
+            response_mime_type='application/json',
+            response_schema=ReceiptAnalysis,
+        )
+    )
+    if not response.text:
+        raise ValueError("Gemini returned an empty response.")
+    return response.text
 
-    prompt_template = f"""
+
+def analyze_receipt_async(image_bytes: bytes, image_digest: str = None) -> Future:
+    """
+    Starts the Gemini receipt analysis on the shared pool and returns its Future,
+    so several receipts can be read concurrently while the script waits on one.
+    """
+    if image_digest is None:
+        image_digest = hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+    return submit_with_ctx(_analyze_receipt_bytes, image_digest, image_bytes)
+
+
+# 💡 도우미 함수: 영수증 선택 목록용 상태 라벨
+def receipt_status(receipt_id: str) -> str:
+    """검토 선택 목록에 표시할 업로드 영수증의 짧은 상태 라벨입니다."""
+    if find_summary_by_id(receipt_id) is not None:
+        return "✅ Saved"
+    result = st.session_state.receipt_results.get(receipt_id)
+    if isinstance(result, Exception):
+        return "❌ Failed"
+    if result is not None:
+        return "📝 Ready to review"
+    if receipt_id in st.session_state.pending_analyses:
+        return "⏳ Analyzing"
+    return "New"
+
+
+# 💡 도우미 함수: 완료된 백그라운드 분석을 receipt_results로 옮깁니다.
+def harvest_analyses() -> bool:
+    """
+    완료된 분석마다 결과(응답 텍스트, API 호출이 실패했다면 예외)를 먼저 receipt_results에 저장한 뒤
+    pending_analyses에서 future를 제거합니다. 완료된 분석이 하나라도 있으면 True를 반환합니다.
+    """
+    pending_analyses = st.session_state.pending_analyses
+    finished_ids = [receipt_id for receipt_id, future in pending_analyses.items() if future.done()]
+    for receipt_id in finished_ids:
+        future = pending_analyses[receipt_id]
+        error = future.exception()
+        if error is None and not future.result():
+            error = ValueError("Gemini returned an empty response.")
+        st.session_state.receipt_results[receipt_id] = future.result() if error is None else error
+        del pending_analyses[receipt_id]
+    return bool(finished_ids)
+
+
+# 💡 도우미 함수: 백그라운드 분석을 막지 않고 기다립니다. 분석이 끝날 때까지 이 fragment만 재실행됩니다.
+@st.fragment(run_every=2)
+def watch_pending_analyses():
+    """2초마다 대기 중인 분석을 확인하고, 하나라도 끝나면 앱 전체를 다시 실행합니다(선택 목록의 상태도 갱신)."""
+    if harvest_analyses():
+        st.rerun()
+    st.caption(f"⏳ {len(st.session_state.pending_analyses)} receipt analysis(es) running in the background...")
+
+
+# 📢 Report prompt template, filled with .format() per call
+REPORT_PROMPT_FMT = """
     You are an expert in receipt analysis and ledger recording, acting as a **friendly yet professional financial advisor**.
     Your analysis must be based strictly on the provided data, ensuring high credibility and clarity.
 
@@ -439,6 +697,21 @@ def generate_ai_analysis(summary_df: pd.DataFrame, store_name: str, total_amount
     3. The response must only contain the analysis content, starting directly with the summary, without any greetings or additional explanations.
     4. **CRITICAL:** When mentioning the total spending amount in the analysis, **you must include the currency unit** (e.g., "Total spending of 1,500,000 KRW").
     """
+
+# --- 2. AI Analysis Report Generation Function ---
+def generate_ai_analysis(summary_df: pd.DataFrame, store_name: str, total_amount: float, currency_unit: str, detailed_items_text: str):
+    """
+    Generates an AI analysis report based on aggregated spending data and detailed items.
+    """
+    # 🌟 추가/수정: summary_df를 문자열로 변환하여 summary_text 변수 정의
+    summary_text = summary_df.to_csv(index=False, sep='|')
+
+    prompt_template = REPORT_PROMPT_FMT.format(
+        total_amount=total_amount,
+        currency_unit=currency_unit,
+        summary_text=summary_text,
+        detailed_items_text=detailed_items_text,
+    )
     
     try:
         response = client.models.generate_content(
@@ -450,6 +723,57 @@ def generate_ai_analysis(summary_df: pd.DataFrame, store_name: str, total_amount
     except Exception as e:
         return "Failed to generate analysis report."
 
+CHAT_WINDOW_MESSAGES = 8    # 항상 원문 그대로 보내는 최근 대화 메시지 수
+CHAT_COMPRESS_AFTER = 16    # 요약되지 않은 메시지가 이만큼 쌓이면 오래된 메시지를 요약에 합칩니다
+
+# 📢 오래된 대화를 압축할 때 .format()으로 채우는 요약 프롬프트
+CHAT_COMPRESS_PROMPT_FMT = """
+    Condense the earlier part of a financial consultation into a short memo (about 120 tokens).
+    Keep the user's stated goals, concerns, and any advice or alternatives already given. Omit greetings.
+
+    --- Previous Memo ---
+    {previous_summary}
+    --- New Messages ---
+    {history_text}
+    ---
+    """
+
+# 💡 헬퍼 함수: 대화 컨텍스트 크기 제한 (누적 요약 + 최근 메시지)
+def build_chat_contents(chat_history: list) -> list:
+    """오래된 대화의 요약과 최근 CHAT_WINDOW_MESSAGES개 메시지 원문으로 Gemini contents를 구성합니다."""
+    memo = st.session_state.get('chat_memory')
+    if memo is None or memo[0] is not chat_history or memo[1] > len(chat_history):
+        memo = (chat_history, 0, "")
+    _, summarized_upto, summary = memo
+    
+    if len(chat_history) - summarized_upto > CHAT_COMPRESS_AFTER:
+        cut = len(chat_history) - CHAT_WINDOW_MESSAGES
+        history_text = "\n".join(f"{msg['role'].capitalize()}: {msg['content']}" for msg in chat_history[summarized_upto:cut])
+        try:
+            response = client.models.generate_content(
+                model='gemini-2.5-flash',
+                contents=[CHAT_COMPRESS_PROMPT_FMT.format(previous_summary=summary or "None", history_text=history_text)],
+            )
+            if response.text:
+                summarized_upto, summary = cut, response.text
+        except Exception:
+            pass  # 이번 턴은 압축 없이 보내고, 다음 메시지에서 다시 시도합니다
+    st.session_state.chat_memory = (chat_history, summarized_upto, summary)
+    
+    contents = []
+    for item in chat_history[summarized_upto:]:
+        gemini_role = "user" if item["role"] == "user" else "model"
+        contents.append({"role": gemini_role, "parts": [{"text": item["content"]}]})
+    if summary:
+        # 요약은 창의 첫 user 턴에 합쳐 user 턴이 연속되지 않도록 합니다.
+        summary_part = {"text": "Prior conversation summary: " + summary}
+        if contents and contents[0]["role"] == "user":
+            contents[0]["parts"].insert(0, summary_part)
+        else:
+            contents.insert(0, {"role": "user", "parts": [summary_part]})
+    return contents
+
+
 # 📢 [NEW] PDF 생성 클래스 (fpdf2 기반)
 class PDF(FPDF):
     def header(self):
@@ -488,17 +812,133 @@ class PDF(FPDF):
 
         # Data rows
         self.set_font('Nanum', '', 8)
-        for _, row in data.iterrows():
-            row_list = [str(item) for item in row.iloc[:len(header_titles)]]
-            
+        # itertuples yields plain tuples (no per-row Series) and keeps each column's dtype
+        for row in data.iloc[:, :num_cols].itertuples(index=False, name=None):
             # 셀 내용이 너무 길어지지 않도록 조정 (테이블 레이아웃 유지)
-            row_list = [item[:25] if len(item) > 25 else item for item in row_list]
+            row_list = [str(item)[:25] for item in row]
             
             for i, item in enumerate(row_list):
                 self.cell(col_width, 6, item, 1, 0, 'C')
             self.ln()
 
 
+NANUM_FONT_FILES = {'': 'fonts/NanumGothic.ttf', 'B': 'fonts/NanumGothicBold.ttf'}
+
+
+# 📢 폰트 파일은 PDF 생성마다가 아니라 프로세스당 한 번만 디스크에서 읽습니다
+@st.cache_resource
+def load_nanum_font_bytes() -> dict:
+    """Reads the Nanum font files into memory once; missing files are skipped."""
+    font_bytes = {}
+    for style, path in NANUM_FONT_FILES.items():
+        try:
+            with open(path, 'rb') as f:
+                font_bytes[style] = f.read()
+        except OSError:
+            pass
+    return font_bytes
+
+
+def add_nanum_fonts(pdf_instance):
+    """Registers Nanum fonts on a PDF from the preloaded bytes. Raises if a font cannot be added."""
+    font_bytes = load_nanum_font_bytes()
+    for style, path in NANUM_FONT_FILES.items():
+        if style in font_bytes:
+            try:
+                pdf_instance.add_font('Nanum', style, io.BytesIO(font_bytes[style]))
+                continue
+            except Exception:
+                pass  # Older fpdf2 only accepts a file path
+        pdf_instance.add_font('Nanum', style, path, uni=True)
+
+
+# 💡 헬퍼 함수: 방금 분석한 영수증의 카테고리 검토 영역. 에디터 수정 시 이 fragment만 다시 실행됩니다.
+@st.fragment
+def render_item_review(items_df: pd.DataFrame, display_unit: str, tax_amount: float, tip_amount: float, geo_future: Future, receipt_info: dict):
+    """편집 가능한 아이템 표를 보여주고, "Save to Ledger" 버튼을 누르면 영수증을 누적 기록에 추가합니다."""
+    st.subheader("🛒 Detailed Item Breakdown (Category Editable)")
+
+    # 데이터 에디터에 할인 전 금액, 할인액, 최종 지출 금액을 보여줍니다.
+    editor_df = items_df.drop(columns=['Total Spend Original', 'Discount Applied', 'Total Spend']) # 임시로 제외
+    # 에디터 컬럼은 항상 일반 문자열로 유지해 재실행 간 위젯 식별자가 바뀌지 않도록 합니다.
+    ai_categories = editor_df['AI Category'].astype(str).tolist()
+    editor_df['AI Category'] = ai_categories
+    saved_categories = st.session_state.receipt_edits.get(receipt_info['id'])
+    if saved_categories is not None:  # 전체 재실행이나 다른 영수증 전환 전에 수정한 카테고리를 복원
+        editor_df['AI Category'] = saved_categories
+    edited_df = st.data_editor(
+        editor_df,
+        column_config={
+            "AI Category": st.column_config.SelectboxColumn(
+                "Final Category",
+                help="Select the correct sub-category for this item.",
+                width="medium",
+                options=ALL_CATEGORIES,
+                required=True,
+            ),
+        },
+        disabled=['Item Name', 'Unit Price', 'Quantity'], 
+        hide_index=True,
+        use_container_width=True,
+        key=f"item_editor_{receipt_info['id']}"
+    )
+    edited_categories = edited_df['AI Category'].tolist()
+    if edited_categories != ai_categories:
+        st.session_state.receipt_edits[receipt_info['id']] = edited_categories
+    else:
+        st.session_state.receipt_edits.pop(receipt_info['id'], None)
+
+    if not st.button("💾 Save to Ledger", key=f"save_receipt_{receipt_info['id']}"):
+        st.caption("Adjust the categories if needed, then save this receipt to the ledger.")
+        return
+    if find_summary_by_id(receipt_info['id']) is not None:
+        return  # Already saved (e.g. a double click)
+
+    # 📢 할인 안분 로직을 통과한 'Total Spend' 컬럼을 다시 edited_df에 합칩니다.
+    edited_df['Total Spend'] = items_df['Total Spend']
+
+    # 📢 Currency Conversion for Accumulation (AI Analysis)
+    edited_df['Currency'] = display_unit
+    edited_df['Total Spend Numeric'] = pd.to_numeric(edited_df['Total Spend'], errors='coerce').fillna(0)
+    edited_df['KRW Total Spend'] = vec_to_krw(edited_df['Total Spend Numeric'], edited_df['Currency'], EXCHANGE_RATES)
+    edited_df = edited_df.drop(columns=['Total Spend Numeric'])
+
+    # 💡 세금과 팁도 원화로 환산
+    krw_tax_total = convert_to_krw(tax_amount, display_unit, EXCHANGE_RATES) 
+    krw_tip_total = convert_to_krw(tip_amount, display_unit, EXCHANGE_RATES)
+
+    # 📢 [NEW] 위치 정보에 대한 좌표 추출
+    # geocode_address_placeholder 대신 실제 API 호출 함수를 사용합니다.
+    lat, lon = geo_future.result()
+
+    # ** Accumulate Data: Store the edited DataFrame **
+    st.session_state.all_receipts_items.append(optimize_df(edited_df))
+
+    # 💡 최종 수정: 한국 영수증의 경우 Tax_KRW는 Total 금액에 다시 합산하지 않고 Tip만 합산합니다.
+    final_total_krw = edited_df['KRW Total Spend'].sum() + krw_tip_total
+
+    st.session_state.all_receipts_summary.append({
+        'id': receipt_info['id'], 
+        'filename': receipt_info['filename'],
+        'Store': receipt_info['Store'],
+        'Total': final_total_krw, # 아이템 총합 + Tip만 더함 (Tax 제외)
+        'Tax_KRW': krw_tax_total, 
+        'Tip_KRW': krw_tip_total, 
+        'Currency': 'KRW', 
+        'Date': receipt_info['Date'], 
+        'Location': receipt_info['Location'], 
+        'Original_Total': receipt_info['Original_Total'], # 교정된 total_amount 사용
+        'Original_Currency': display_unit,
+        # 📢 [NEW] 좌표 추가
+        'latitude': lat,
+        'longitude': lon
+    })
+
+    st.session_state.receipt_results.pop(receipt_info['id'], None)
+    st.session_state.receipt_edits.pop(receipt_info['id'], None)
+    st.rerun()  # Full rerun: the cumulative report picks up the new receipt
+
+
 # ----------------------------------------------------------------------
 # 📌 4. Streamlit UI: Tab Setup (Translated)
 # ----------------------------------------------------------------------
@@ -538,17 +978,21 @@ with tab1:
             st.session_state.csv_load_triggered = False # 재실행 방지를 위해 즉시 초기화
             
             try:
-                # CSV 파일을 DataFrame으로 읽기
-                imported_df = pd.read_csv(uploaded_csv_file)
+                # 본문을 읽기 전에 헤더 행만 먼저 읽어 필수 컬럼 검증 (잘못된 파일은 빠르게 거부)
+                header_cols = pd.read_csv(uploaded_csv_file, nrows=0).columns
+                uploaded_csv_file.seek(0)
                 
-                # 필수 컬럼 검증
                 required_cols = ['Item Name', 'Unit Price', 'Quantity', 'AI Category', 'Total Spend', 'Currency', 'KRW Total Spend']
+                missing_cols = set(required_cols).difference(header_cols)
                 
-                if not all(col in imported_df.columns for col in required_cols):
+                if missing_cols:
                     st.error("❌ 업로드된 CSV 파일에 필수 컬럼이 부족합니다. 올바른 형식의 파일을 업로드해주세요.")
                 else:
+                    # CSV 파일을 DataFrame으로 읽기
+                    imported_df = pd.read_csv(uploaded_csv_file)
+                    
                     # 1. 아이템 목록에 추가
-                    st.session_state.all_receipts_items.append(imported_df)
+                    st.session_state.all_receipts_items.append(optimize_df(imported_df))
                     
                     # 2. Summary 데이터 재구성 및 추가
                     summary_data = regenerate_summary_data(imported_df)
@@ -565,30 +1009,62 @@ with tab1:
     # 2. Image Upload Section (Right Column)
     with col_img:
         st.markdown("**Upload Receipt Image (AI Analysis)**")
-        uploaded_file = st.file_uploader(
-            "Upload one receipt image (jpg, png) at a time.", 
+        uploaded_files = st.file_uploader(
+            "Upload receipt images (jpg, png). Several receipts are analyzed in parallel.", 
             type=['jpg', 'png', 'jpeg'],
-            accept_multiple_files=False,
+            accept_multiple_files=True,
             key='receipt_uploader' # CSV Uploader와 키 충돌 방지
-        )
+        ) or []
+        
+        # 📢 내용 기반 ID: 이름만 바꾼 재업로드도 감지합니다.
+        receipt_ids = [hashlib.blake2b(receipt.getvalue(), digest_size=16).hexdigest() for receipt in uploaded_files]
+        pending_analyses = st.session_state.pending_analyses
+        receipt_results = st.session_state.receipt_results
+
+        # 업로더에서 제거된 영수증의 분석 상태는 정리합니다.
+        current_ids = set(receipt_ids)
+        for state_key in ('pending_analyses', 'receipt_results', 'receipt_edits'):
+            stored = st.session_state[state_key]
+            for stale_id in stored.keys() - current_ids:
+                del stored[stale_id]
+
+        # 완료된 분석은 결과로 옮겨 두어 영수증을 전환해도 유지됩니다.
+        harvest_analyses()
+
+        selected_index = 0
+        if len(uploaded_files) > 1:
+            # 📢 새 영수증을 모두 공유 스레드 풀에 한 번에 제출하고, 아래에서 하나씩 검토합니다.
+            if st.button(f"✨ Analyze All {len(uploaded_files)} Receipts"):
+                for receipt, receipt_id in zip(uploaded_files, receipt_ids):
+                    # 실패한 분석은 다시 제출하고, 검토 대기 중인 결과는 그대로 둡니다.
+                    if find_summary_by_id(receipt_id) is None and receipt_id not in pending_analyses and not isinstance(receipt_results.get(receipt_id), str):
+                        receipt_results.pop(receipt_id, None)
+                        pending_analyses[receipt_id] = analyze_receipt_async(receipt.getvalue(), receipt_id)
+            selected_index = st.selectbox(
+                "Receipt to review",
+                range(len(uploaded_files)),
+                format_func=lambda i: f"{uploaded_files[i].name} · {receipt_status(receipt_ids[i])}",
+                key='receipt_review_select'
+            )
+        uploaded_file = uploaded_files[selected_index] if uploaded_files else None
 
 
     st.markdown("---")
     # --- 📢 [NEW] CSV/Image Upload Section End ---
 
     if uploaded_file is not None:
-        file_id = f"{uploaded_file.name}-{uploaded_file.size}"
+        receipt_bytes = uploaded_file.getvalue()
+        file_id = receipt_ids[selected_index]
         
         # 💡 중복 파일 체크
-        existing_summary = next((s for s in st.session_state.all_receipts_summary if s.get('id') == file_id), None)
+        existing_summary = find_summary_by_id(file_id)
         is_already_analyzed = existing_summary is not None
         
         # UI 레이아웃 변경 (이미지 표시 및 분석 결과)
         col1, col2 = st.columns(2)
         with col1:
             st.subheader("🖼️ Uploaded Receipt")
-            image = Image.open(uploaded_file)
-            st.image(image, use_container_width=True) 
+            st.image(make_receipt_preview(file_id, receipt_bytes), use_container_width=True) 
 
         with col2:
             st.subheader("📊 Analysis and Recording")
@@ -628,203 +1104,157 @@ with tab1:
                 analyze_button = st.button("✨ Start Receipt Analysis")
 
 
-            if analyze_button and not is_already_analyzed:
-                
-                st.info("💡 Starting Gemini analysis. This may take 10-20 seconds.")
-                with st.spinner('AI is reading the receipt...'):
-                    
-                    json_data_text = analyze_receipt_with_gemini(image)
+            if analyze_button and not is_already_analyzed and file_id not in pending_analyses:
+                st.session_state.receipt_results.pop(file_id, None)  # 새 분석이 실패한 결과를 대체
+                pending_analyses[file_id] = analyze_receipt_async(receipt_bytes, file_id)
 
-                    if json_data_text:
-                        try:
-                            # 💡 JSON 클리닝 로직 강화
-                            cleaned_text = json_data_text.strip()
-                            if cleaned_text.startswith("```json"):
-                                cleaned_text = cleaned_text.lstrip("```json")
-                            if cleaned_text.endswith("```"):
-                                cleaned_text = cleaned_text.rstrip("```")
-                            
-                            receipt_data = json.loads(cleaned_text.strip()) 
+            if file_id in pending_analyses and not is_already_analyzed:
+                st.info("💡 AI is reading the receipt. This may take 10-20 seconds; the review appears here when it is done.")
+
+            if pending_analyses:
+                # fragment 안에서 확인하므로 Gemini가 분석하는 동안에도 화면을 사용할 수 있습니다.
+                watch_pending_analyses()
+
+            # 📢 "Save to Ledger"를 누를 때까지 결과를 보관해, 이후의 재실행에서도 검토 내용이 유지됩니다.
+            json_data_text = st.session_state.receipt_results.get(file_id)
+            if isinstance(json_data_text, Exception) and not is_already_analyzed:
+                st.error(f"Gemini API call failed: {json_data_text}. Please try again.")
+            elif json_data_text is not None and not is_already_analyzed:
+                try:
+                    # JSON 모드: 응답 텍스트 자체가 JSON 객체
+                    receipt_data = json_loads(json_data_text)
                             
-                            # 데이터 유효성 검사 및 기본값 설정 (safe_get_amount 사용)
-                            total_amount = safe_get_amount(receipt_data, 'total_amount')
-                            tax_amount = safe_get_amount(receipt_data, 'tax_amount')
-                            tip_amount = safe_get_amount(receipt_data, 'tip_amount')
-                            discount_amount = safe_get_amount(receipt_data, 'discount_amount') # ⬅️ **[추가: 할인액 추출]**
+                    # 데이터 유효성 검사 및 기본값 설정 (safe_get_amount 사용)
+                    total_amount = safe_get_amount(receipt_data, 'total_amount')
+                    tax_amount = safe_get_amount(receipt_data, 'tax_amount')
+                    tip_amount = safe_get_amount(receipt_data, 'tip_amount')
+                    discount_amount = safe_get_amount(receipt_data, 'discount_amount') # ⬅️ **[추가: 할인액 추출]**
                             
-                            currency_unit = receipt_data.get('currency_unit', '').strip()
-                            display_unit = currency_unit if currency_unit else 'KRW'
+                    currency_unit = receipt_data.get('currency_unit', '').strip()
+                    display_unit = currency_unit if currency_unit else 'KRW'
                             
-                            # 💡 날짜와 위치 기본값 처리 로직 추가 (강력한 포맷 검사 포함)
-                            receipt_date_str = receipt_data.get('date', '').strip()
-                            store_location_str = receipt_data.get('store_location', '').strip()
+                    # 💡 날짜와 위치 기본값 처리 로직 추가 (강력한 포맷 검사 포함)
+                    receipt_date_str = receipt_data.get('date', '').strip()
+                    store_location_str = receipt_data.get('store_location', '').strip()
                             
-                            try:
-                                # ISO 8601 형식 (YYYY-MM-DD)으로 강제 변환 시도
-                                date_object = pd.to_datetime(receipt_date_str, format='%Y-%m-%d', errors='raise').date()
-                                final_date = date_object.strftime('%Y-%m-%d')
-                            except (ValueError, TypeError):
-                                # 변환에 실패하면 오늘 날짜를 기본값으로 사용
-                                final_date = datetime.date.today().strftime('%Y-%m-%d')
-                                st.warning("⚠️ AI가 인식한 날짜가 유효하지 않아 오늘 날짜로 대체되었습니다.")
+                    try:
+                        # ISO 8601 형식 (YYYY-MM-DD)으로 강제 변환 시도
+                        date_object = pd.to_datetime(receipt_date_str, format='%Y-%m-%d', errors='raise').date()
+                        final_date = date_object.strftime('%Y-%m-%d')
+                    except (ValueError, TypeError):
+                        # 변환에 실패하면 오늘 날짜를 기본값으로 사용
+                        final_date = datetime.date.today().strftime('%Y-%m-%d')
+                        st.warning("⚠️ AI가 인식한 날짜가 유효하지 않아 오늘 날짜로 대체되었습니다.")
                                 
-                            # 위치 기본값: 유효하지 않거나 빈 문자열이면 "Seoul" 사용
-                            final_location = store_location_str if store_location_str else "Seoul"
+                    # 위치 기본값: 유효하지 않거나 빈 문자열이면 "Seoul" 사용
+                    final_location = store_location_str if store_location_str else "Seoul"
+                    geo_future = geocode_address_async(final_location)
 
                             
-                            # --- 📢 [NEW] 금액 검증 및 덮어쓰기 로직 시작 (OVRRIDE) ---
-                            # 1. 아이템 데이터프레임 생성 및 기본 계산
-                            if 'items' in receipt_data and receipt_data['items']:
-                                items_df = pd.DataFrame(receipt_data['items'])
+                    # --- 📢 [NEW] 금액 검증 및 덮어쓰기 로직 시작 (OVRRIDE) ---
+                    # 1. 아이템 데이터프레임 생성 및 기본 계산
+                    if 'items' in receipt_data and receipt_data['items']:
+                        # JSON 아이템 목록에서 단가/수량을 바로 NumPy 배열로 변환
+                        items = receipt_data['items']
+                        unit_prices = np.fromiter((safe_get_amount(item, 'price', 0.0) for item in items), dtype=np.float64, count=len(items))
+                        quantities = np.fromiter((safe_get_amount(item, 'quantity', 1.0) for item in items), dtype=np.float64, count=len(items))
+                        item_totals = unit_prices * quantities
                                 
-                                items_df.columns = ['Item Name', 'Unit Price', 'Quantity', 'AI Category']
-                                items_df['Unit Price'] = pd.to_numeric(items_df['Unit Price'], errors='coerce').fillna(0)
-                                items_df['Quantity'] = pd.to_numeric(items_df['Quantity'], errors='coerce').fillna(1)
+                        items_df = pd.DataFrame({
+                            'Item Name': [item.get('name', '') for item in items],
+                            'Unit Price': unit_prices,
+                            'Quantity': quantities,
+                            'AI Category': [item.get('category', 'Unclassified') for item in items],  # 일반 문자열로 두고, 저장 시 optimize_df가 CATEGORY_DTYPE을 적용
+                        })
                                 
-                                # 2. 아이템 원가 총합 (할인 적용 전, Tax 포함) 계산
-                                calculated_original_total = (items_df['Unit Price'] * items_df['Quantity']).sum()
-                                total_discount = safe_get_amount(receipt_data, 'discount_amount') 
+                        # 2. 아이템 원가 총합 (할인 적용 전, Tax 포함) 계산
+                        calculated_original_total = item_totals.sum()
+                        total_discount = safe_get_amount(receipt_data, 'discount_amount') 
                                 
-                                # 3. 아이템 합계를 기반으로 최종 지불액 재계산 (이론적 합계)
-                                calculated_final_total = calculated_original_total - total_discount
+                        # 3. 아이템 합계를 기반으로 최종 지불액 재계산 (이론적 합계)
+                        calculated_final_total = calculated_original_total - total_discount
                                 
-                                # 4. AI가 추출한 total_amount와 비교하여 덮어쓰기
-                                # 오차 허용 범위: 100원
-                                if abs(calculated_final_total - total_amount) > 100 and calculated_final_total > 0:
-                                    st.warning(
-                                        f"⚠️ AI 추출 총액({total_amount:,.0f} {display_unit})이 아이템 합계({calculated_final_total:,.0f} {display_unit})와 크게 다릅니다. "
-                                        f"**아이템 합계로 총액을 교정합니다.**"
-                                    )
-                                    # AI가 잘못 읽은 total_amount를 아이템 합계로 덮어씁니다.
-                                    total_amount = calculated_final_total
+                        # 4. AI가 추출한 total_amount와 비교하여 덮어쓰기
+                        # 오차 허용 범위: 100원
+                        if abs(calculated_final_total - total_amount) > 100 and calculated_final_total > 0:
+                            st.warning(
+                                f"⚠️ AI 추출 총액({total_amount:,.0f} {display_unit})이 아이템 합계({calculated_final_total:,.0f} {display_unit})와 크게 다릅니다. "
+                                f"**아이템 합계로 총액을 교정합니다.**"
+                            )
+                            # AI가 잘못 읽은 total_amount를 아이템 합계로 덮어씁니다.
+                            total_amount = calculated_final_total
                                 
-                                # --- 📢 [NEW] 금액 검증 및 덮어쓰기 로직 종료 ---
+                        # --- 📢 [NEW] 금액 검증 및 덮어쓰기 로직 종료 ---
                             
                                 
-                                # --- Main Information Display ---
-                                st.success("✅ Analysis Complete! Check the ledger data below.")
+                        # --- Main Information Display ---
+                        st.success("✅ Analysis Complete! Check the ledger data below.")
                                 
-                                st.markdown(f"**🏠 Store Name:** {receipt_data.get('store_name', 'N/A')}")
-                                st.markdown(f"**📍 Location:** {final_location}") 
-                                st.markdown(f"**📅 Date:** {final_date}") 
-                                # 교정된 total_amount를 표시합니다.
-                                st.subheader(f"💰 Total Amount Paid (Corrected): {total_amount:,.0f} {display_unit}")
+                        st.markdown(f"**🏠 Store Name:** {receipt_data.get('store_name', 'N/A')}")
+                        st.markdown(f"**📍 Location:** {final_location}") 
+                        st.markdown(f"**📅 Date:** {final_date}") 
+                        # 교정된 total_amount를 표시합니다.
+                        st.subheader(f"💰 Total Amount Paid (Corrected): {total_amount:,.0f} {display_unit}")
 
-                                if discount_amount > 0:
-                                    discount_display = f"{discount_amount:,.2f} {display_unit}"
-                                    st.markdown(f"**🎁 Total Discount:** {discount_display}") 
+                        if discount_amount > 0:
+                            discount_display = f"{discount_amount:,.2f} {display_unit}"
+                            st.markdown(f"**🎁 Total Discount:** {discount_display}") 
 
                                 
-                                # 💡 세금/팁 정보 표시
-                                if tax_amount > 0 or tip_amount > 0:
-                                    tax_display = f"{tax_amount:,.2f} {display_unit}"
-                                    tip_display = f"{tip_amount:,.2f} {display_unit}"
-                                    st.markdown(f"**🧾 Tax/VAT:** {tax_display} | **💸 Tip:** {tip_display}")
+                        # 💡 세금/팁 정보 표시
+                        if tax_amount > 0 or tip_amount > 0:
+                            tax_display = f"{tax_amount:,.2f} {display_unit}"
+                            tip_display = f"{tip_amount:,.2f} {display_unit}"
+                            st.markdown(f"**🧾 Tax/VAT:** {tax_display} | **💸 Tip:** {tip_display}")
                                 
-                                # 💡 Display Applied Exchange Rate for AI Analysis
-                                if display_unit != 'KRW':
-                                    applied_rate = EXCHANGE_RATES.get(display_unit, 1.0)
-                                    st.info(f"**📢 Applied Exchange Rate:** 1 {display_unit} = {applied_rate:,.4f} KRW (Rate fetched from API/Fallback)")
+                        # 💡 Display Applied Exchange Rate for AI Analysis
+                        if display_unit != 'KRW':
+                            applied_rate = EXCHANGE_RATES.get(display_unit, 1.0)
+                            st.info(f"**📢 Applied Exchange Rate:** 1 {display_unit} = {applied_rate:,.4f} KRW (Rate fetched from API/Fallback)")
                                     
-                                st.markdown("---")
+                        st.markdown("---")
 
-                                # 📢 할인 안분(Allocation) 로직 시작! - 로직 안정화 (Robust Initialization)
-                                # items_df는 이제 `calculated_original_total`이 계산된 상태입니다.
-                                items_df['Total Spend Original'] = items_df['Unit Price'] * items_df['Quantity']
-                                items_df['Discount Applied'] = 0.0
-                                items_df['Total Spend'] = items_df['Total Spend Original']
+                        # 📢 할인 안분(Allocation) 로직 시작! - 로직 안정화 (Robust Initialization)
+                        # items_df는 이제 `calculated_original_total`이 계산된 상태입니다.
+                        items_df['Total Spend Original'] = item_totals
+                        items_df['Discount Applied'] = 0.0
+                        items_df['Total Spend'] = item_totals
                                 
-                                total_item_original = items_df['Total Spend Original'].sum()
+                        total_item_original = calculated_original_total
                                 
-                                # 🌟 2단계: 할인이 있을 경우에만 재계산
-                                # total_discount는 AI가 추출한 양수 값입니다.
-                                if total_discount > 0 and total_item_original > 0:
-                                    # 할인 비율 계산: 품목 원가 총합 대비 할인액 비율
-                                    discount_rate = total_discount / total_item_original
+                        # 🌟 2단계: 할인이 있을 경우에만 재계산
+                        # total_discount는 AI가 추출한 양수 값입니다.
+                        if total_discount > 0 and total_item_original > 0:
+                            # 할인 비율 계산: 품목 원가 총합 대비 할인액 비율
+                            discount_rate = total_discount / total_item_original
                                     
-                                    # 품목별 할인액 계산 및 실제 지출액 (Total Spend)으로 업데이트
-                                    items_df['Discount Applied'] = items_df['Total Spend Original'] * discount_rate
-                                    items_df['Total Spend'] = items_df['Total Spend Original'] - items_df['Discount Applied']
-                                    st.info(f"💡 Discount of {total_discount:,.0f} {display_unit} successfully allocated across items.")
-                                else:
-                                    pass
+                            # 품목별 할인액 계산 및 실제 지출액 (Total Spend)으로 업데이트
+                            discount_applied = item_totals * discount_rate
+                            items_df['Discount Applied'] = discount_applied
+                            items_df['Total Spend'] = item_totals - discount_applied
+                            st.info(f"💡 Discount of {total_discount:,.0f} {display_unit} successfully allocated across items.")
+                        else:
+                            pass
                                     
-                                # 📢 할인 안분 로직 종료. Total Spend는 이제 할인이 반영된 금액입니다.
+                        # 📢 할인 안분 로직 종료. Total Spend는 이제 할인이 반영된 금액입니다.
                                 
-                                st.subheader("🛒 Detailed Item Breakdown (Category Editable)")
-                                
-                                # 데이터 에디터에 할인 전 금액, 할인액, 최종 지출 금액을 보여줍니다.
-                                edited_df = st.data_editor(
-                                    items_df.drop(columns=['Total Spend Original', 'Discount Applied', 'Total Spend']), # 임시로 제외
-                                    column_config={
-                                        "AI Category": st.column_config.SelectboxColumn(
-                                            "Final Category",
-                                            help="Select the correct sub-category for this item.",
-                                            width="medium",
-                                            options=ALL_CATEGORIES,
-                                            required=True,
-                                        ),
-                                    },
-                                    disabled=['Item Name', 'Unit Price', 'Quantity'], 
-                                    hide_index=True,
-                                    use_container_width=True
-                                )
-                                
-                                # 📢 할인 안분 로직을 통과한 'Total Spend' 컬럼을 다시 edited_df에 합칩니다.
-                                edited_df['Total Spend'] = items_df['Total Spend']
-                                edited_df['Total Spend Numeric'] = pd.to_numeric(edited_df['Total Spend'], errors='coerce').fillna(0)
-                                edited_df['Currency'] = display_unit
-                                
-                                # 📢 Currency Conversion for Accumulation (AI Analysis)
-                                edited_df['Currency'] = display_unit
-                                edited_df['Total Spend Numeric'] = pd.to_numeric(edited_df['Total Spend'], errors='coerce').fillna(0)
-                                edited_df['KRW Total Spend'] = edited_df.apply(
-                                    lambda row: convert_to_krw(row['Total Spend Numeric'], row['Currency'], EXCHANGE_RATES), axis=1
-                                )
-                                edited_df = edited_df.drop(columns=['Total Spend Numeric'])
+                        render_item_review(items_df, display_unit, tax_amount, tip_amount, geo_future, {
+                            'id': file_id,
+                            'filename': uploaded_file.name,
+                            'Store': receipt_data.get('store_name', 'N/A'),
+                            'Date': final_date,
+                            'Location': final_location,
+                            'Original_Total': total_amount,
+                        })
 
-                                # 💡 세금과 팁도 원화로 환산
-                                krw_tax_total = convert_to_krw(tax_amount, display_unit, EXCHANGE_RATES) 
-                                krw_tip_total = convert_to_krw(tip_amount, display_unit, EXCHANGE_RATES)
-                                
-                                # 📢 [NEW] 위치 정보에 대한 좌표 추출
-                                # geocode_address_placeholder 대신 실제 API 호출 함수를 사용합니다.
-                                lat, lon = geocode_address(final_location)
-                                
-                                # ** Accumulate Data: Store the edited DataFrame **
-                                st.session_state.all_receipts_items.append(edited_df)
-                                
-                                # 💡 최종 수정: 한국 영수증의 경우 Tax_KRW는 Total 금액에 다시 합산하지 않고 Tip만 합산합니다.
-                                final_total_krw = edited_df['KRW Total Spend'].sum() + krw_tip_total
-                                
-                                st.session_state.all_receipts_summary.append({
-                                    'id': file_id, 
-                                    'filename': uploaded_file.name,
-                                    'Store': receipt_data.get('store_name', 'N/A'),
-                                    'Total': final_total_krw, # 아이템 총합 + Tip만 더함 (Tax 제외)
-                                    'Tax_KRW': krw_tax_total, 
-                                    'Tip_KRW': krw_tip_total, 
-                                    'Currency': 'KRW', 
-                                    'Date': final_date, 
-                                    'Location': final_location, 
-                                    'Original_Total': total_amount, # 교정된 total_amount 사용
-                                    'Original_Currency': display_unit,
-                                    # 📢 [NEW] 좌표 추가
-                                    'latitude': lat,
-                                    'longitude': lon
-                                })
-
-                                st.success(f"🎉 Data from {uploaded_file.name} successfully added (Converted to KRW)!")
-
-                            else:
-                                st.warning("Item list could not be found in the analysis result.")
-
-                        except json.JSONDecodeError:
-                            st.error("❌ Gemini analysis result is not a valid JSON format. (JSON parsing error)")
-                        except Exception as e:
-                            st.error(f"Unexpected error occurred during data processing: {e}")
                     else:
-                        st.error("Analysis failed to complete. Please try again.")
+                        st.warning("Item list could not be found in the analysis result.")
+
+                except json.JSONDecodeError:
+                    st.session_state.receipt_results.pop(file_id, None)
+                    st.error("❌ Gemini analysis result is not a valid JSON format. (JSON parsing error)")
+                except Exception as e:
+                    st.error(f"Unexpected error occurred during data processing: {e}")
 
     st.markdown("---")
     
@@ -885,7 +1315,7 @@ with tab1:
                 
                 # 2. Prepare Summary Data
                 manual_summary = {
-                    'id': f"manual-{pd.Timestamp.now().timestamp()}", 
+                    'id': f"manual-{time.time_ns()}", 
                     'filename': 'Manual Entry',
                     'Store': manual_store if manual_store else 'Manual Entry',
                     'Total': krw_total, # 수동 입력은 총액을 그대로 사용 (Tip/Tax는 0)
@@ -902,7 +1332,7 @@ with tab1:
                 }
                 
                 # 3. Accumulate Data
-                st.session_state.all_receipts_items.append(manual_df)
+                st.session_state.all_receipts_items.append(optimize_df(manual_df))
                 st.session_state.all_receipts_summary.append(manual_summary)
                 
                 # 💡 Modified Success Message
@@ -922,394 +1352,392 @@ with tab1:
     # --- 5. Cumulative Data Analysis Section (ALL ANALYSIS IS KRW BASED) ---
     # ----------------------------------------------------------------------
 
-    if st.session_state.all_receipts_items:
-        st.markdown("---")
-        st.title("📚 Cumulative Spending Analysis Report")
+    @st.fragment
+    def render_cumulative_analysis():
+        """누적 분석 리포트입니다. fragment로 실행되어 이 영역의 위젯은 이 영역만 다시 실행합니다."""
+        if st.session_state.all_receipts_items:
+            st.markdown("---")
+            st.title("📚 Cumulative Spending Analysis Report")
         
-        # 1. Create a single DataFrame from all accumulated items
-        all_items_df_numeric = pd.concat(st.session_state.all_receipts_items, ignore_index=True)
+            # 1. Create a single DataFrame from all accumulated items
+            all_items_df_numeric = get_all_items_df()
         
-        # Defensive coding: KRW Total Spend must exist for analysis
-        if 'KRW Total Spend' not in all_items_df_numeric.columns:
-             st.warning("Old data structure detected. Recalculating KRW totals...")
-             all_items_df_numeric['KRW Total Spend'] = all_items_df_numeric.apply(
-                 lambda row: convert_to_krw(row['Total Spend'], row['Currency'], EXCHANGE_RATES), axis=1
-             )
+            # Defensive coding: KRW Total Spend must exist for analysis
+            if 'KRW Total Spend' not in all_items_df_numeric.columns:
+                 st.warning("Old data structure detected. Recalculating KRW totals...")
+                 all_items_df_numeric['KRW Total Spend'] = vec_to_krw(all_items_df_numeric['Total Spend'], all_items_df_numeric['Currency'], EXCHANGE_RATES)
 
-        display_currency_label = 'KRW'
+            display_currency_label = 'KRW'
 
 
-        # A. Display Accumulated Receipts Summary Table (Translated/Modified)
-        st.subheader(f"Total {len(st.session_state.all_receipts_summary)} Receipts Logged (Summary)")
-        summary_df = pd.DataFrame(st.session_state.all_receipts_summary)
+            # A. Display Accumulated Receipts Summary Table (Translated/Modified)
+            st.subheader(f"Total {len(st.session_state.all_receipts_summary)} Receipts Logged (Summary)")
+            summary_df = get_summary_df()
         
-        # Ensure compatibility with older sessions that lack columns
-        if 'Original_Total' not in summary_df.columns:
-            summary_df['Original_Total'] = summary_df['Total'] 
-        if 'Original_Currency' not in summary_df.columns:
-            summary_df['Original_Currency'] = 'KRW' 
-        if 'Tax_KRW' not in summary_df.columns:
-            summary_df['Tax_KRW'] = 0.0
-        if 'Tip_KRW' not in summary_df.columns:
-            summary_df['Tip_KRW'] = 0.0
-        if 'Location' not in summary_df.columns:
-            summary_df['Location'] = 'N/A'
-        # 📢 [NEW] 좌표 컬럼 호환성 확보
-        if 'latitude' not in summary_df.columns:
-            summary_df['latitude'] = 37.5665
-        if 'longitude' not in summary_df.columns:
-            summary_df['longitude'] = 126.9780
+            # Ensure compatibility with older sessions that lack columns
+            if 'Original_Total' not in summary_df.columns:
+                summary_df['Original_Total'] = summary_df['Total'] 
+            if 'Original_Currency' not in summary_df.columns:
+                summary_df['Original_Currency'] = 'KRW' 
+            if 'Tax_KRW' not in summary_df.columns:
+                summary_df['Tax_KRW'] = 0.0
+            if 'Tip_KRW' not in summary_df.columns:
+                summary_df['Tip_KRW'] = 0.0
+            if 'Location' not in summary_df.columns:
+                summary_df['Location'] = 'N/A'
+            # 📢 [NEW] 좌표 컬럼 호환성 확보
+            if 'latitude' not in summary_df.columns:
+                summary_df['latitude'] = 37.5665
+            if 'longitude' not in summary_df.columns:
+                summary_df['longitude'] = 126.9780
             
-        # Conditional formatting for Amount Paid
-        def format_amount_paid(row):
-            krw_amount = f"{row['Total']:,.0f} KRW"
-            
-            if row['Original_Currency'] != 'KRW':
-                original_amount = f"{row['Original_Total']:,.2f} {row['Original_Currency']}"
-                return f"{original_amount} / {krw_amount}"
-            
-            return krw_amount
-        
-        summary_df['Amount Paid'] = summary_df.apply(format_amount_paid, axis=1)
+            # Conditional formatting for Amount Paid
+            krw_amount = summary_df['Total'].map('{:,.0f} KRW'.format)
+            original_amount = summary_df['Original_Total'].map('{:,.2f}'.format) + ' ' + summary_df['Original_Currency'].astype(str)
+            summary_df['Amount Paid'] = krw_amount.where(summary_df['Original_Currency'] == 'KRW', original_amount + ' / ' + krw_amount)
 
         
-        summary_df = summary_df.drop(columns=['id'])
-        # 💡 Location 컬럼을 추가하여 표시
-        summary_df_display = summary_df[['Date', 'Store', 'Location', 'Amount Paid', 'Tax_KRW', 'Tip_KRW', 'filename']] 
-        summary_df_display.columns = ['Date', 'Store', 'Location', 'Amount Paid', 'Tax (KRW)', 'Tip (KRW)', 'Source'] 
-
-        st.dataframe(
-            summary_df_display, 
-            use_container_width=True, 
-            hide_index=True,
-            column_config={
-                "Tax (KRW)": st.column_config.NumberColumn(
-                    "Tax (KRW)", 
-                    format="%.0f KRW" # 소수점 없이 KRW 표시
-                ),
-                "Tip (KRW)": st.column_config.NumberColumn(
-                    "Tip (KRW)", 
-                    format="%.0f KRW" # 소수점 없이 KRW 표시
-                ),
-            }
-        )
+            summary_df = summary_df.drop(columns=['id'])
+            # 💡 Location 컬럼을 추가하여 표시
+            summary_df_display = summary_df[['Date', 'Store', 'Location', 'Amount Paid', 'Tax_KRW', 'Tip_KRW', 'filename']] 
+            summary_df_display.columns = ['Date', 'Store', 'Location', 'Amount Paid', 'Tax (KRW)', 'Tip (KRW)', 'Source'] 
+
+            st.dataframe(
+                summary_df_display, 
+                use_container_width=True, 
+                hide_index=True,
+                column_config={
+                    "Tax (KRW)": st.column_config.NumberColumn(
+                        "Tax (KRW)", 
+                        format="%.0f KRW" # 소수점 없이 KRW 표시
+                    ),
+                    "Tip (KRW)": st.column_config.NumberColumn(
+                        "Tip (KRW)", 
+                        format="%.0f KRW" # 소수점 없이 KRW 표시
+                    ),
+                }
+            )
         
-        st.markdown("---")
+            st.markdown("---")
         
-        # 📢 [NEW] Spending Trend and Map Visualization in Parallel
-        col_trend, col_map = st.columns(2)
+            # 📢 [NEW] Spending Trend and Map Visualization in Parallel
+            col_trend, col_map = st.columns(2)
         
-        with col_trend:
-            # --- Spending Trend Over Time Chart (KRW based) ---
-            st.subheader("📈 Spending Trend Over Time")
+            with col_trend:
+                # --- Spending Trend Over Time Chart (KRW based) ---
+                st.subheader("📈 Spending Trend Over Time")
             
-            summary_df_raw = pd.DataFrame(st.session_state.all_receipts_summary)
+                summary_df_raw = get_summary_df()
             
-            if not summary_df_raw.empty:
+                if not summary_df_raw.empty:
                 
-                summary_df_raw['Date'] = pd.to_datetime(summary_df_raw['Date'], errors='coerce')
-                summary_df_raw['Total'] = pd.to_numeric(summary_df_raw['Total'], errors='coerce') 
+                    summary_df_raw['Date'] = pd.to_datetime(summary_df_raw['Date'], errors='coerce')
+                    summary_df_raw['Total'] = pd.to_numeric(summary_df_raw['Total'], errors='coerce') 
                 
-                daily_spending = summary_df_raw.dropna(subset=['Date', 'Total'])
-                daily_spending = daily_spending.groupby('Date')['Total'].sum().reset_index()
-                daily_spending.columns = ['Date', 'Daily Total Spend']
+                    daily_spending = summary_df_raw.dropna(subset=['Date', 'Total'])
+                    daily_spending = daily_spending.groupby('Date')['Total'].sum().reset_index()
+                    daily_spending.columns = ['Date', 'Daily Total Spend']
                 
-                if not daily_spending.empty:
-                    fig_trend = px.line(
-                        daily_spending, x='Date', y='Daily Total Spend',
-                        title=f'Daily Spending Trend (Unit: {display_currency_label})',
-                        labels={'Daily Total Spend': f'Total Spend ({display_currency_label})', 'Date': 'Date'},
-                        markers=True
-                    )
-                    fig_trend.update_layout(margin=dict(t=30, b=0, l=0, r=0), height=400)
-                    st.plotly_chart(fig_trend, use_container_width=True)
-                else:
-                    st.warning("Date data is not available or not properly formatted to show the trend chart.")
+                    if not daily_spending.empty:
+                        import plotly.express as px  # 📢 지연 임포트: 차트를 그릴 때만 plotly를 불러옵니다
+                        fig_trend = px.line(
+                            daily_spending, x='Date', y='Daily Total Spend',
+                            title=f'Daily Spending Trend (Unit: {display_currency_label})',
+                            labels={'Daily Total Spend': f'Total Spend ({display_currency_label})', 'Date': 'Date'},
+                            markers=True
+                        )
+                        fig_trend.update_layout(margin=dict(t=30, b=0, l=0, r=0), height=400)
+                        st.plotly_chart(fig_trend, use_container_width=True)
+                    else:
+                        st.warning("Date data is not available or not properly formatted to show the trend chart.")
         
-        with col_map:
-            # --- Spending Map Visualization Section ---
-            st.subheader("📍 Spending Map Visualization")
+            with col_map:
+                # --- Spending Map Visualization Section ---
+                st.subheader("📍 Spending Map Visualization")
             
-            map_df = summary_df.copy()
-            # st.map은 'lat'과 'lon' 컬럼을 기대합니다.
-            map_df.columns = [col.replace('latitude', 'lat').replace('longitude', 'lon') for col in map_df.columns]
+                map_df = summary_df.copy()
+                # st.map은 'lat'과 'lon' 컬럼을 기대합니다.
+                map_df.columns = [col.replace('latitude', 'lat').replace('longitude', 'lon') for col in map_df.columns]
     
-            if not map_df.empty and 'lat' in map_df.columns and 'lon' in map_df.columns:
+                if not map_df.empty and 'lat' in map_df.columns and 'lon' in map_df.columns:
                 
-                map_data = map_df[map_df['Total'] > 0].dropna(subset=['lat', 'lon'])
+                    map_data = map_df[map_df['Total'] > 0].dropna(subset=['lat', 'lon'])
                 
-                if not map_data.empty:
-                    st.map(
-                        map_data, 
-                        latitude='lat', 
-                        longitude='lon', 
-                        color='#ff6347', # 산호색
-                        zoom=11, 
-                        use_container_width=True
-                    )
+                    if not map_data.empty:
+                        st.map(
+                            map_data, 
+                            latitude='lat', 
+                            longitude='lon', 
+                            color='#ff6347', # 산호색
+                            zoom=11, 
+                            use_container_width=True
+                        )
                 
+                    else:
+                        st.warning("유효한 좌표 정보가 있는 지출 기록이 없어 지도를 표시할 수 없습니다.")
                 else:
-                    st.warning("유효한 좌표 정보가 있는 지출 기록이 없어 지도를 표시할 수 없습니다.")
-            else:
-                st.warning("위치 정보가 없거나 좌표 컬럼이 유효하지 않아 지도를 표시할 수 없습니다.")
+                    st.warning("위치 정보가 없거나 좌표 컬럼이 유효하지 않아 지도를 표시할 수 없습니다.")
 
 
-        st.markdown("---")
+            st.markdown("---")
         
-        st.subheader("🛒 Integrated Detail Items") 
+            st.subheader("🛒 Integrated Detail Items") 
         
-        all_items_df_display = all_items_df_numeric.copy()
+            all_items_df_display = all_items_df_numeric[['Item Name', 'AI Category']].copy()
         
-        all_items_df_display['Original Total'] = all_items_df_display.apply(
-            lambda row: f"{row['Total Spend']:,.2f} {row['Currency']}", axis=1
-        )
-        all_items_df_display['KRW Equivalent'] = all_items_df_display['KRW Total Spend'].apply(
-            lambda x: f"{x:,.0f} KRW"
-        )
+            all_items_df_display['Original Total'] = (
+                all_items_df_numeric['Total Spend'].map('{:,.2f}'.format) + ' ' + all_items_df_numeric['Currency'].astype(str)
+            )
+            all_items_df_display['KRW Equivalent'] = all_items_df_numeric['KRW Total Spend'].map('{:,.0f} KRW'.format)
         
-        st.dataframe(
-            all_items_df_display[['Item Name', 'Original Total', 'KRW Equivalent', 'AI Category']], 
-            use_container_width=True, 
-            hide_index=True
-        )
+            st.dataframe(
+                all_items_df_display[['Item Name', 'Original Total', 'KRW Equivalent', 'AI Category']], 
+                use_container_width=True, 
+                hide_index=True
+            )
 
-        # 2. Aggregate spending by category and visualize (KRW based)
-        category_summary = all_items_df_numeric.groupby('AI Category')['KRW Total Spend'].sum().reset_index()
-        category_summary.columns = ['Category', 'Amount']
+            # 2. Aggregate spending by category and visualize (KRW based)
+            category_amounts = dict(sorted(get_category_totals().items()))
         
-        # 💡 세금과 팁도 별도의 카테고리로 합산하여 표시
-        # 📢 [FIX] 'Tax (KRW)' 대신 실제 컬럼 이름인 'Tax_KRW'를 사용합니다.
-        total_tax_krw = summary_df['Tax_KRW'].sum()
-        # 📢 [FIX] 'Tip (KRW)' 대신 실제 컬럼 이름인 'Tip_KRW'를 사용합니다.
-        total_tip_krw = summary_df['Tip_KRW'].sum()
+            # 💡 세금과 팁도 별도의 카테고리로 합산하여 표시
+            # 📢 [FIX] 'Tax (KRW)' 대신 실제 컬럼 이름인 'Tax_KRW'를 사용합니다.
+            total_tax_krw = summary_df['Tax_KRW'].sum()
+            # 📢 [FIX] 'Tip (KRW)' 대신 실제 컬럼 이름인 'Tip_KRW'를 사용합니다.
+            total_tip_krw = summary_df['Tip_KRW'].sum()
         
-        if total_tax_krw > 0:
-            category_summary.loc[len(category_summary)] = ['세금/부가세 (Tax/VAT)', total_tax_krw]
-        if total_tip_krw > 0:
-            category_summary.loc[len(category_summary)] = ['팁 (Tip)', total_tip_krw]
+            if total_tax_krw > 0:
+                category_amounts['세금/부가세 (Tax/VAT)'] = total_tax_krw
+            if total_tip_krw > 0:
+                category_amounts['팁 (Tip)'] = total_tip_krw
+            category_series = pd.Series(category_amounts, name='Amount', dtype='float64').rename_axis('Category')
+            category_summary = category_series.reset_index()
             
-        # --- Display Summary Table ---
-        st.subheader("💰 Spending Summary by Category (Items + Tax + Tip)") 
-        category_summary_display = category_summary.copy()
-        category_summary_display['Amount'] = category_summary_display['Amount'].apply(lambda x: f"{x:,.0f} {display_currency_label}")
-        st.dataframe(category_summary_display, use_container_width=True, hide_index=True)
-
-        # --- Visualization (Charts use KRW Amount) ---
-        col_chart, col_pie = st.columns(2)
+            # --- Display Summary Table ---
+            st.subheader("💰 Spending Summary by Category (Items + Tax + Tip)") 
+            category_summary_display = category_summary.copy()
+            category_summary_display['Amount'] = category_summary_display['Amount'].apply(lambda x: f"{x:,.0f} {display_currency_label}")
+            st.dataframe(category_summary_display, use_container_width=True, hide_index=True)
+
+            # --- Visualization (Charts use KRW Amount) ---
+            col_chart, col_pie = st.columns(2)
         
-        with col_chart:
-            st.subheader(f"Bar Chart Visualization (Unit: {display_currency_label})")
-            st.bar_chart(category_summary.set_index('Category'))
+            with col_chart:
+                st.subheader(f"Bar Chart Visualization (Unit: {display_currency_label})")
+                st.bar_chart(category_series)
             
-        with col_pie:
-            st.subheader(f"Pie Chart Visualization (Unit: {display_currency_label})")
-            chart_data = category_summary[category_summary['Amount'] > 0] 
+            with col_pie:
+                st.subheader(f"Pie Chart Visualization (Unit: {display_currency_label})")
+                chart_data = category_summary[category_summary['Amount'] > 0] 
             
-            if not chart_data.empty:
-                fig = px.pie(
-                    chart_data, values='Amount', names='Category', 
-                    title=f'Spending Distribution by Category (Unit: {display_currency_label})', hole=.3, 
-                )
-                fig.update_traces(textposition='inside', textinfo='percent+label')
-                fig.update_layout(margin=dict(t=30, b=0, l=0, r=0), height=400)
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.warning("No spending data found to generate the pie chart.")
+                if not chart_data.empty:
+                    def build_category_pie():
+                        import plotly.express as px
+                        fig = px.pie(
+                            chart_data, values='Amount', names='Category', 
+                            title=f'Spending Distribution by Category (Unit: {display_currency_label})', hole=.3, 
+                        )
+                        fig.update_traces(textposition='inside', textinfo='percent+label')
+                        fig.update_layout(margin=dict(t=30, b=0, l=0, r=0), height=400)
+                        return fig
+                    
+                    st.plotly_chart(ledger_memo('category_pie_cache', build_category_pie), use_container_width=True)
+                else:
+                    st.warning("No spending data found to generate the pie chart.")
         
-        # 4. Reset and Download Buttons
-        st.markdown("---")
-        @st.cache_data
-        def convert_df_to_csv(df):
-            return df.to_csv(index=False, encoding='utf-8-sig')
-
-        csv = convert_df_to_csv(all_items_df_numeric) 
-        st.download_button(
-            label="⬇️ Download Full Cumulative Ledger Data (CSV)",
-            data=csv,
-            file_name=f"record_{pd.Timestamp.now().strftime('%Y%m%d')}.csv",
-            mime='text/csv',
-        )
+            # 4. Reset and Download Buttons
+            st.markdown("---")
+            csv = ledger_memo('ledger_csv_cache', lambda: convert_df_to_csv(all_items_df_numeric))
+            st.download_button(
+                label="⬇️ Download Full Cumulative Ledger Data (CSV)",
+                data=csv,
+                file_name=f"record_{datetime.date.today().strftime('%Y%m%d')}.csv",
+                mime='text/csv',
+            )
+
+            if st.button("🧹 Reset Record", help="Clears all accumulated receipt analysis records in the app."):
+                st.session_state.all_receipts_items = []
+                st.session_state.all_receipts_summary = []
+                st.session_state.chat_history = [] 
+                for memo_key in ('all_items_df_cache', 'report_items_df_cache', 'category_totals_cache', 'psychological_summary_cache', 'chat_items_text_cache', 'ledger_csv_cache', 'category_pie_cache', 'summary_df_cache', 'summary_id_index'):
+                    st.session_state.pop(memo_key, None)
+                st.rerun() 
 
-        if st.button("🧹 Reset Record", help="Clears all accumulated receipt analysis records in the app."):
-            st.session_state.all_receipts_items = []
-            st.session_state.all_receipts_summary = []
-            st.session_state.chat_history = [] 
-            st.rerun() 
+    render_cumulative_analysis()
 
 # ======================================================================
 # 		 	TAB 2: FINANCIAL EXPERT CHAT (수정됨)
 # ======================================================================
 with tab2:
-    st.header("💬 Financial Expert Chat")
+    @st.fragment
+    def render_chat_tab():
+        """상담 탭입니다. fragment로 실행되어 메시지를 보내도 분석 탭은 다시 실행되지 않습니다."""
+        st.header("💬 Financial Expert Chat")
     
-    if not st.session_state.all_receipts_items:
-        st.warning("Please analyze at least one receipt or load a CSV in the 'Analysis & Tracking' tab before starting a consultation.")
-    else:
-        # --- 🌟 Chat History Reset Logic (Fix 2) 🌟 ---
-        current_data_hash = hash(tuple(item['id'] for item in st.session_state.all_receipts_summary))
+        if not st.session_state.all_receipts_items:
+            st.warning("Please analyze at least one receipt or load a CSV in the 'Analysis & Tracking' tab before starting a consultation.")
+        else:
+            # --- 🌟 Chat History Reset Logic (Fix 2) 🌟 ---
+            current_data_hash = hash(tuple(item['id'] for item in st.session_state.all_receipts_summary))
         
-        if 'last_data_hash' not in st.session_state or st.session_state.last_data_hash != current_data_hash:
-            st.session_state.chat_history = []
-            st.session_state.last_data_hash = current_data_hash
-            st.info("📊 새로운 지출 내역이 감지되었습니다. 신선한 분석을 위해 채팅 기록이 초기화됩니다.")
+            if 'last_data_hash' not in st.session_state or st.session_state.last_data_hash != current_data_hash:
+                st.session_state.chat_history = []
+                st.session_state.last_data_hash = current_data_hash
+                st.info("📊 새로운 지출 내역이 감지되었습니다. 신선한 분석을 위해 채팅 기록이 초기화됩니다.")
         
-        all_items_df = pd.concat(st.session_state.all_receipts_items, ignore_index=True)
+            all_items_df = get_all_items_df()
         
-        if 'KRW Total Spend' not in all_items_df.columns:
-             all_items_df['KRW Total Spend'] = all_items_df.apply(
-                 lambda row: convert_to_krw(row['Total Spend'], row['Currency'], EXCHANGE_RATES), axis=1
-             )
+            if 'KRW Total Spend' not in all_items_df.columns:
+                 all_items_df['KRW Total Spend'] = vec_to_krw(all_items_df['Total Spend'], all_items_df['Currency'], EXCHANGE_RATES)
 
-        # 1. Add Psychological Category to the detailed DataFrame
-        all_items_df['Psychological Category'] = all_items_df['AI Category'].apply(get_psychological_category)
+            # 1. Add Psychological Category to the detailed DataFrame
+            all_items_df['Psychological Category'] = map_psychological_category(all_items_df['AI Category'])
 
-        # 2. Group by the new Psychological Category
-        psychological_summary = all_items_df.groupby('Psychological Category')['KRW Total Spend'].sum().reset_index()
-        psychological_summary.columns = ['Category', 'KRW Total Spend']
+            # 2. Group by the new Psychological Category
+            psychological_summary = ledger_memo(
+                'psychological_summary_cache',
+                lambda: all_items_df.groupby('Psychological Category')['KRW Total Spend'].sum().reset_index()
+            ).copy()
+            psychological_summary.columns = ['Category', 'KRW Total Spend']
 
-        # 3. Add Tip only to Fixed/Essential Cost 
-        summary_df_for_chat = pd.DataFrame(st.session_state.all_receipts_summary)
+            # 3. Add Tip only to Fixed/Essential Cost 
+            summary_df_for_chat = get_summary_df()
         
-        tax_tip_only_total = 0.0
+            tax_tip_only_total = 0.0
         
-        if 'Tip_KRW' in summary_df_for_chat.columns:
-            tax_tip_only_total += summary_df_for_chat['Tip_KRW'].sum() # Tip만 합산합니다.
+            if 'Tip_KRW' in summary_df_for_chat.columns:
+                tax_tip_only_total += summary_df_for_chat['Tip_KRW'].sum() # Tip만 합산합니다.
         
-        # Add Tip (Only) to the 'Fixed / Essential Cost' category
-        if tax_tip_only_total > 0:
-            fixed_cost_index = psychological_summary[psychological_summary['Category'] == PSYCHOLOGICAL_CATEGORIES[3]].index
-            if not fixed_cost_index.empty:
-                psychological_summary.loc[fixed_cost_index[0], 'KRW Total Spend'] += tax_tip_only_total 
-            else:
-                new_row = pd.DataFrame([{'Category': PSYCHOLOGICAL_CATEGORIES[3], 'KRW Total Spend': tax_tip_only_total}])
-                psychological_summary = pd.concat([psychological_summary, new_row], ignore_index=True)
+            # Add Tip (Only) to the 'Fixed / Essential Cost' category
+            if tax_tip_only_total > 0:
+                fixed_cost_index = psychological_summary[psychological_summary['Category'] == PSYCHOLOGICAL_CATEGORIES[3]].index
+                if not fixed_cost_index.empty:
+                    psychological_summary.loc[fixed_cost_index[0], 'KRW Total Spend'] += tax_tip_only_total 
+                else:
+                    new_row = pd.DataFrame([{'Category': PSYCHOLOGICAL_CATEGORIES[3], 'KRW Total Spend': tax_tip_only_total}])
+                    psychological_summary = pd.concat([psychological_summary, new_row], ignore_index=True)
 
-        total_spent = psychological_summary['KRW Total Spend'].sum()
+            total_spent = psychological_summary['KRW Total Spend'].sum()
         
-        # 📢 [NEW] 정교한 충동 지수 계산 로직
-        impulse_spending = psychological_summary.loc[psychological_summary['Category'] == PSYCHOLOGICAL_CATEGORIES[2], 'KRW Total Spend'].sum()
+            # 📢 [NEW] 정교한 충동 지수 계산 로직
+            impulse_spending = psychological_summary.loc[psychological_summary['Category'] == PSYCHOLOGICAL_CATEGORIES[2], 'KRW Total Spend'].sum()
         
-        total_transactions = len(all_items_df)
-        impulse_transactions = len(all_items_df[all_items_df['Psychological Category'] == PSYCHOLOGICAL_CATEGORIES[2]])
+            total_transactions = len(all_items_df)
+            impulse_transactions = len(all_items_df[all_items_df['Psychological Category'] == PSYCHOLOGICAL_CATEGORIES[2]])
         
-        if total_spent > 0 and total_transactions > 0:
-            # 1. 금액 기반 비율
-            amount_ratio = impulse_spending / total_spent
-            # 2. 빈도 기반 비율 (충동 지출이 전체 거래에서 차지하는 비중의 제곱근)
-            frequency_ratio_factor = np.sqrt(impulse_transactions / total_transactions)
+            if total_spent > 0 and total_transactions > 0:
+                # 1. 금액 기반 비율
+                amount_ratio = impulse_spending / total_spent
+                # 2. 빈도 기반 비율 (충동 지출이 전체 거래에서 차지하는 비중의 제곱근)
+                frequency_ratio_factor = np.sqrt(impulse_transactions / total_transactions)
             
-            # 3. 최종 정교화된 지수 (금액 비율 * 빈도 가중치)
-            impulse_index = amount_ratio * frequency_ratio_factor
-        else:
-            impulse_index = 0.0
-        # 📢 [NEW] 정교한 충동 지수 계산 로직 종료
+                # 3. 최종 정교화된 지수 (금액 비율 * 빈도 가중치)
+                impulse_index = amount_ratio * frequency_ratio_factor
+            else:
+                impulse_index = 0.0
+            # 📢 [NEW] 정교한 충동 지수 계산 로직 종료
         
-        psychological_summary_text = psychological_summary.to_string(index=False)
+            psychological_summary_text = psychological_summary.to_string(index=False)
         
-        # 📢 [NEW] 대안 추천 로직을 위한 최고 충동 지출 카테고리/항목 계산
-        highest_impulse_category = ""
-        highest_impulse_amount = 0
+            # 📢 [NEW] 대안 추천 로직을 위한 최고 충동 지출 카테고리/항목 계산
+            highest_impulse_category = ""
+            highest_impulse_amount = 0
         
-        impulse_items_df = all_items_df[all_items_df['Psychological Category'] == PSYCHOLOGICAL_CATEGORIES[2]]
+            impulse_items_df = all_items_df[all_items_df['Psychological Category'] == PSYCHOLOGICAL_CATEGORIES[2]]
         
-        if not impulse_items_df.empty:
-            impulse_category_sum = impulse_items_df.groupby('AI Category')['KRW Total Spend'].sum()
-            if not impulse_category_sum.empty:
-                highest_impulse_category = impulse_category_sum.idxmax()
-                highest_impulse_amount = impulse_category_sum.max()
+            if not impulse_items_df.empty:
+                impulse_category_sum = impulse_items_df.groupby('AI Category', observed=True, sort=False)['KRW Total Spend'].sum()
+                if not impulse_category_sum.empty:
+                    highest_impulse_category = impulse_category_sum.idxmax()
+                    highest_impulse_amount = impulse_category_sum.max()
         
-        detailed_items_for_chat = all_items_df[['Psychological Category', 'Item Name', 'KRW Total Spend']]
-        items_text_for_chat = detailed_items_for_chat.to_string(index=False)
+            items_text_for_chat = ledger_memo(
+                'chat_items_text_cache',
+                lambda: all_items_df[['Psychological Category', 'Item Name', 'KRW Total Spend']].to_string(index=False)
+            )
         
-        # MODIFIED SYSTEM INSTRUCTION (CRITICAL)
-        # 📢 [MODIFIED] Alternative Recommendation Task에 효용 최적화 지침 추가
-        system_instruction = f"""
-        You are a supportive, friendly, and highly knowledgeable Financial Psychologist and Advisor. Your role is to analyze the user's spending habits from a **psychological and behavioral economics perspective**, and provide personalized advice on overcoming impulse spending and optimizing happiness per won. Your tone should be consistently polite and helpful, like a professional mentor.
+            # MODIFIED SYSTEM INSTRUCTION (CRITICAL)
+            # 📢 [MODIFIED] Alternative Recommendation Task에 효용 최적화 지침 추가
+            system_instruction = f"""
+            You are a supportive, friendly, and highly knowledgeable Financial Psychologist and Advisor. Your role is to analyze the user's spending habits from a **psychological and behavioral economics perspective**, and provide personalized advice on overcoming impulse spending and optimizing happiness per won. Your tone should be consistently polite and helpful, like a professional mentor.
         
-        The user's cumulative spending data for the current session (All converted to KRW) is analyzed by its **Psychological Spending Nature**:
-        - **Total Accumulated Spending**: {total_spent:,.0f} KRW
-        - **Calculated Impulse Spending Index (Refined)**: {impulse_index:.2f} (Target: < 0.15 for Refined Index)
-        - **Psychological Category Breakdown (Category, Amount)**:
-        {psychological_summary_text}
+            The user's cumulative spending data for the current session (All converted to KRW) is analyzed by its **Psychological Spending Nature**:
+            - **Total Accumulated Spending**: {total_spent:,.0f} KRW
+            - **Calculated Impulse Spending Index (Refined)**: {impulse_index:.2f} (Target: < 0.15 for Refined Index)
+            - **Psychological Category Breakdown (Category, Amount)**:
+            {psychological_summary_text}
         
-        **CRITICAL DETAILED DATA:** Below are the individual item names, their original AI categories, and total costs. Use this data to provide qualitative and specific advice (e.g., mention specific products or stores, or refer to high-frequency, low-value items that drive the Impulse Index).
-        --- Detailed Items Data (Psychological Category, Item Name, KRW Total Spend) ---
-        {items_text_for_chat}
-        ---
+            **CRITICAL DETAILED DATA:** Below are the individual item names, their original AI categories, and total costs. Use this data to provide qualitative and specific advice (e.g., mention specific products or stores, or refer to high-frequency, low-value items that drive the Impulse Index).
+            --- Detailed Items Data (Psychological Category, Item Name, KRW Total Spend) ---
+            {items_text_for_chat}
+            ---
 
-        --- Alternative Recommendation Task (NEW - Utility Optimization) ---
-        The user's highest impulse/loss spending is in the **'{highest_impulse_category}'** category, amounting to **{highest_impulse_amount:,.0f} KRW**.
+            --- Alternative Recommendation Task (NEW - Utility Optimization) ---
+            The user's highest impulse/loss spending is in the **'{highest_impulse_category}'** category, amounting to **{highest_impulse_amount:,.0f} KRW**.
         
-        When the user asks for alternatives or efficiency advice, you MUST prioritize and perform the following:
-        1. Identify the core utility (e.g., comfort, energy, pleasure, time-saving, social belonging) the user gains from spending on **'{highest_impulse_category}'** or a specific high-frequency impulse item.
-        2. Propose 2-3 specific, actionable, and low-cost alternatives that satisfy the *same core utility* while aiming to **reduce the expense by at least 30%**.
-        3. Examples of alternatives: *Home-brewed coffee for routine, pre-planning walking route instead of taxi, frozen meal kit instead of dining out.*
+            When the user asks for alternatives or efficiency advice, you MUST prioritize and perform the following:
+            1. Identify the core utility (e.g., comfort, energy, pleasure, time-saving, social belonging) the user gains from spending on **'{highest_impulse_category}'** or a specific high-frequency impulse item.
+            2. Propose 2-3 specific, actionable, and low-cost alternatives that satisfy the *same core utility* while aiming to **reduce the expense by at least 30%**.
+            3. Examples of alternatives: *Home-brewed coffee for routine, pre-planning walking route instead of taxi, frozen meal kit instead of dining out.*
 
-        Base all your advice and responses on this data. Your analysis MUST start with a professional interpretation of the **Impulse Spending Index (Refined)**. Provide actionable, psychological tips to convert 'Impulse Loss' spending into 'Investment/Asset' spending. Always include the currency unit (KRW) when referring to monetary amounts.
-        """
+            Base all your advice and responses on this data. Your analysis MUST start with a professional interpretation of the **Impulse Spending Index (Refined)**. Provide actionable, psychological tips to convert 'Impulse Loss' spending into 'Investment/Asset' spending. Always include the currency unit (KRW) when referring to monetary amounts.
+            """
 
-        # 💡 초기 메시지 추가 (UX 개선)
-        if not st.session_state.chat_history or (len(st.session_state.chat_history) == 1 and st.session_state.chat_history[0]["content"].startswith("안녕하세요! 저는 귀하의 지출 패턴을 분석하는")):
-              st.session_state.chat_history = []
+            # 💡 초기 메시지 추가 (UX 개선)
+            if not st.session_state.chat_history or (len(st.session_state.chat_history) == 1 and st.session_state.chat_history[0]["content"].startswith("안녕하세요! 저는 귀하의 지출 패턴을 분석하는")):
+                  st.session_state.chat_history = []
               
-              if highest_impulse_category:
-                  impulse_info = f"가장 높은 충동성 지출은 **{highest_impulse_category}** 카테고리이며, 총 **{highest_impulse_amount:,.0f} KRW**입니다."
-              else:
-                  impulse_info = "아직 충동성 지출 항목이 명확하게 분석되지 않았습니다."
-
-              initial_message = f"""
-              안녕하세요! 저는 귀하의 소비 심리 패턴을 분석하는 AI 금융 심리 전문가입니다. 🧠
-              현재까지 총 **{total_spent:,.0f} KRW**의 지출이 기록되었으며,
-              귀하의 **정교한 소비 충동성 지수 (Refined Impulse Index)**는 **{impulse_index:.2f}**으로 분석되었습니다. (목표치는 0.15 이하)
-              {impulse_info}
-
-              어떤 부분에 대해 더 자세한 심리적 조언을 드릴까요? 예를 들어, 다음과 같은 질문을 할 수 있습니다.
-
-              * **"제 정교한 충동성 지수 {impulse_index:.2f}이 의미하는 바는 무엇인가요?"**
-              * **"제일 많이 쓰는 충동성 항목({highest_impulse_category} 등)의 비용을 줄일 대안을 추천해주세요."**
-              * "지출을 **'미래 투자(Investment / Asset)'**로 전환하려면 어떻게 해야 할까요?"
-              """
-              st.session_state.chat_history.append({"role": "assistant", "content": initial_message})
-
-        # Display chat history
-        for message in st.session_state.chat_history:
-            with st.chat_message(message["role"]):
-                st.markdown(message["content"])
-
-        # Process user input
-        if prompt := st.chat_input("Ask for financial advice or review your spending..."):
+                  if highest_impulse_category:
+                      impulse_info = f"가장 높은 충동성 지출은 **{highest_impulse_category}** 카테고리이며, 총 **{highest_impulse_amount:,.0f} KRW**입니다."
+                  else:
+                      impulse_info = "아직 충동성 지출 항목이 명확하게 분석되지 않았습니다."
+
+                  initial_message = f"""
+                  안녕하세요! 저는 귀하의 소비 심리 패턴을 분석하는 AI 금융 심리 전문가입니다. 🧠
+                  현재까지 총 **{total_spent:,.0f} KRW**의 지출이 기록되었으며,
+                  귀하의 **정교한 소비 충동성 지수 (Refined Impulse Index)**는 **{impulse_index:.2f}**으로 분석되었습니다. (목표치는 0.15 이하)
+                  {impulse_info}
+
+                  어떤 부분에 대해 더 자세한 심리적 조언을 드릴까요? 예를 들어, 다음과 같은 질문을 할 수 있습니다.
+
+                  * **"제 정교한 충동성 지수 {impulse_index:.2f}이 의미하는 바는 무엇인가요?"**
+                  * **"제일 많이 쓰는 충동성 항목({highest_impulse_category} 등)의 비용을 줄일 대안을 추천해주세요."**
+                  * "지출을 **'미래 투자(Investment / Asset)'**로 전환하려면 어떻게 해야 할까요?"
+                  """
+                  st.session_state.chat_history.append({"role": "assistant", "content": initial_message})
+
+            # Display chat history
+            for message in st.session_state.chat_history:
+                with st.chat_message(message["role"]):
+                    st.markdown(message["content"])
+
+            # Process user input
+            if prompt := st.chat_input("Ask for financial advice or review your spending..."):
             
-            st.session_state.chat_history.append({"role": "user", "content": prompt})
-            with st.chat_message("user"):
-                st.markdown(prompt)
+                st.session_state.chat_history.append({"role": "user", "content": prompt})
+                with st.chat_message("user"):
+                    st.markdown(prompt)
 
-            with st.chat_message("assistant"):
-                with st.spinner("Expert is thinking..."):
-                    try:
-                        combined_contents = []
-                        history_items = st.session_state.chat_history 
-                        
-                        for item in history_items:
-                            gemini_role = "user" if item["role"] == "user" else "model" 
-                            
-                            combined_contents.append({
-                                "role": gemini_role, 
-                                "parts": [{"text": item["content"]}]
-                            })
+                with st.chat_message("assistant"):
+                    with st.spinner("Expert is thinking..."):
+                        try:
+                            combined_contents = build_chat_contents(st.session_state.chat_history)
                         
-                        response = client.models.generate_content(
-                            model='gemini-2.5-flash',
-                            contents=combined_contents, 
-                            config=genai.types.GenerateContentConfig(
-                                system_instruction=system_instruction
+                            # Stream the reply so the first tokens render while Gemini is still generating
+                            stream = client.models.generate_content_stream(
+                                model='gemini-2.5-flash',
+                                contents=combined_contents, 
+                                config=genai.types.GenerateContentConfig(
+                                    system_instruction=system_instruction
+                                )
                             )
-                        )
                         
-                        st.markdown(response.text)
-                        st.session_state.chat_history.append({"role": "assistant", "content": response.text})
+                            response_text = st.write_stream(chunk.text for chunk in stream if chunk.text)
+                            st.session_state.chat_history.append({"role": "assistant", "content": response_text})
                         
-                    except Exception as e:
-                        st.error(f"Chatbot API call failed: {e}")
+                        except Exception as e:
+                            st.error(f"Chatbot API call failed: {e}")
+
+    render_chat_tab()
 
 # ======================================================================
 # 		 	TAB 3: PDF REPORT GENERATOR (NEW)
@@ -1328,23 +1756,28 @@ with tab3:
         summary_list = st.session_state.all_receipts_summary
         items_list = st.session_state.all_receipts_items
         
-        items_with_meta = []
-        for item_df, summary in zip(items_list, summary_list):
-            item_df_copy = item_df.copy()
-            
-            if 'Date' not in item_df_copy.columns:
-                item_df_copy['Date'] = summary.get('Date', 'N/A')
-            if 'Store' not in item_df_copy.columns:
-                item_df_copy['Store'] = summary.get('Store', 'N/A')
+        def build_items_with_meta():
+            items_with_meta = []
+            for item_df, summary in zip(items_list, summary_list):
+                item_df_copy = item_df.copy(deep=False)
                 
-            items_with_meta.append(item_df_copy)
+                if 'Date' not in item_df_copy.columns:
+                    item_df_copy['Date'] = summary.get('Date', 'N/A')
+                if 'Store' not in item_df_copy.columns:
+                    item_df_copy['Store'] = summary.get('Store', 'N/A')
+                    
+                items_with_meta.append(item_df_copy)
+            return pd.concat(items_with_meta, ignore_index=True)
             
-        all_items_df = pd.concat(items_with_meta, ignore_index=True)
+        all_items_df = ledger_memo('report_items_df_cache', build_items_with_meta).copy(deep=False)
         
-        all_items_df['Psychological Category'] = all_items_df['AI Category'].apply(get_psychological_category)
+        all_items_df['Psychological Category'] = map_psychological_category(all_items_df['AI Category'])
         
         # 심리적 요약 데이터
-        psychological_summary_pdf = all_items_df.groupby('Psychological Category')['KRW Total Spend'].sum().reset_index()
+        psychological_summary_pdf = ledger_memo(
+            'psychological_summary_cache',
+            lambda: all_items_df.groupby('Psychological Category')['KRW Total Spend'].sum().reset_index()
+        ).copy()
         psychological_summary_pdf.columns = ['Category', 'Amount (KRW)']
         total_spent = psychological_summary_pdf['Amount (KRW)'].sum()
         
@@ -1364,7 +1797,7 @@ with tab3:
         highest_impulse_category = "N/A"
         impulse_items_df = all_items_df[all_items_df['Psychological Category'] == PSYCHOLOGICAL_CATEGORIES[2]]
         if not impulse_items_df.empty:
-            highest_impulse_category_calc = impulse_items_df.groupby('AI Category')['KRW Total Spend'].sum()
+            highest_impulse_category_calc = impulse_items_df.groupby('AI Category', observed=True, sort=False)['KRW Total Spend'].sum()
             if not highest_impulse_category_calc.empty:
                 highest_impulse_category = highest_impulse_category_calc.idxmax()
         
@@ -1377,8 +1810,7 @@ with tab3:
             # 폰트 로딩 실패 시 바로 None을 반환하도록 로직 변경
             try:
                  # 폰트 파일이 'fonts/' 폴더 안에 있다고 가정하고 상대 경로를 지정합니다.
-                 pdf.add_font('Nanum', '', 'fonts/NanumGothic.ttf', uni=True) 
-                 pdf.add_font('Nanum', 'B', 'fonts/NanumGothicBold.ttf', uni=True)
+                 add_nanum_fonts(pdf)
                  pdf.set_font('Nanum', '', 10) # 기본 폰트 설정
             except Exception as e:
                  # 폰트 로드 실패 시 None 반환 및 사용자에게 오류 표시
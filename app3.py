@@ -1,17 +1,37 @@
 import streamlit as st
+import hashlib
 import json
 import pandas as pd
-from PIL import Image
+from PIL import Image, ImageOps
 import io
 import datetime 
 import numpy as np
-import plotly.express as px
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from google import genai
 from google.genai.types import HarmCategory, HarmBlockThreshold 
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from pydantic import BaseModel
 import time 
 from fpdf import FPDF 
 
+# orjson (C extension) parses the Gemini receipt JSON much faster than the stdlib; fall back if it is not installed.
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# pyarrow (installed with streamlit) writes CSV in C; the ledger export falls back to pandas without it.
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+
 # ----------------------------------------------------------------------
 # 📌 0. Currency Conversion Setup & Globals
 # ----------------------------------------------------------------------
@@ -26,8 +46,21 @@ except KeyError:
     st.error("❌ Please set 'GEMINI_API_KEY', 'EXCHANGE_RATE_API_KEY', and 'KAKAO_REST_API_KEY' in Streamlit Secrets.")
     st.stop()
 
-# Initialize GenAI client
-client = genai.Client(api_key=API_KEY)
+# Initialize GenAI client (held across reruns so its HTTP connection pool is reused)
+@st.cache_resource
+def get_genai_client(api_key: str) -> genai.Client:
+    return genai.Client(api_key=api_key)
+
+client = get_genai_client(API_KEY)
+
+# Shared HTTP session for Kakao / ExchangeRate-API calls (keep-alive connections are reused across reruns)
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+    session.mount("https://", adapter)
+    return session
 
 # --- 📢 [UPDATED] Geocoding Helper Function (Kakao API Optimized) ---
 @st.cache_data(ttl=datetime.timedelta(hours=48))
@@ -45,9 +78,9 @@ def geocode_address(address: str) -> tuple[float, float]:
     params = {"query": address}
 
     try:
-        response = requests.get(url, headers=headers, params=params, timeout=5)
+        response = get_http_session().get(url, headers=headers, params=params, timeout=5)
         response.raise_for_status()
-        data = response.json()
+        data = json_loads(response.content)
         
         if data and data.get('documents'):
             document = data['documents'][0]
@@ -67,19 +100,143 @@ def geocode_address(address: str) -> tuple[float, float]:
     return 37.5665, 126.9780
 
 
+# 💡 Background work (geocoding, receipt analysis): the pool lives in cache_resource so it survives Streamlit reruns.
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=4)
+
+
+def submit_with_ctx(fn, *args) -> Future:
+    """Runs fn(*args) on the shared pool with the current script context attached."""
+    ctx = get_script_run_ctx()
+
+    def _run():
+        # Attach the script context so st.cache_data / st.* calls work inside the worker.
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args)
+
+    return get_executor().submit(_run)
+
+
+def geocode_address_async(address: str) -> Future:
+    """Starts geocode_address on the shared pool so the Kakao call overlaps with UI rendering."""
+    return submit_with_ctx(geocode_address, address)
+
+
 # 💡 Helper function: Safely extracts a single amount value
-def safe_get_amount(data, key):
-    """Safely extracts a single value and returns 0.0 if non-numeric or missing."""
-    value = data.get(key, 0)
-    numeric_value = pd.to_numeric(value, errors='coerce')
-    return numeric_value if not pd.isna(numeric_value) else 0.0
+def safe_get_amount(data, key, default=0.0):
+    """Safely extracts a single value and returns `default` (0.0) if non-numeric or missing."""
+    value = data.get(key, default)
+    if isinstance(value, (int, float)):
+        # Fast path: the JSON decoder already produced a number (NaN != NaN)
+        return float(value) if value == value else default
+    try:
+        numeric_value = float(value)
+    except (TypeError, ValueError):
+        return default
+    return numeric_value if numeric_value == numeric_value else default
+
+# 💡 Helper function: Shrinks accumulated item DataFrames before they are stored in session state
+def optimize_df(df: pd.DataFrame) -> pd.DataFrame:
+    """Stores AI Category as CATEGORY_DTYPE (plain category for off-list labels), other text columns as category, and Quantity as float32; amounts stay float64 to keep full KRW precision."""
+    cat_cols = [col for col in ['Currency', 'Store'] if col in df.columns]
+    money_cols = [col for col in ['Unit Price', 'Total Spend', 'KRW Total Spend'] if col in df.columns]
+    if 'AI Category' in df.columns:
+        ai_category = df['AI Category']
+        in_vocabulary = (ai_category.isna() | ai_category.isin(ALL_CATEGORIES)).all()
+        df['AI Category'] = ai_category.astype(CATEGORY_DTYPE if in_vocabulary else 'category')
+    if cat_cols:
+        df[cat_cols] = df[cat_cols].astype('category')
+    if money_cols:
+        df[money_cols] = df[money_cols].apply(pd.to_numeric, errors='coerce').astype('float64')
+    if 'Quantity' in df.columns:
+        df['Quantity'] = pd.to_numeric(df['Quantity'], errors='coerce', downcast='float')
+    return df
+
+# 💡 Helper function: O(1) lookup of an analyzed receipt by its summary id
+def find_summary_by_id(summary_id: str):
+    """Returns the summary dict with this id (or None), using an id index rebuilt only when summaries change."""
+    summaries = st.session_state.all_receipts_summary
+    index = st.session_state.get('summary_id_index')
+    if index is None or index[0] is not summaries or index[1] != len(summaries):
+        index = (summaries, len(summaries), {s.get('id'): s for s in summaries})
+        st.session_state.summary_id_index = index
+    return index[2].get(summary_id)
+
+# 💡 Helper function: Summary list as a DataFrame, rebuilt only when receipts are added or the record is reset
+def get_summary_df() -> pd.DataFrame:
+    """Returns a shallow copy of pd.DataFrame(all_receipts_summary), memoized in session state."""
+    summaries = st.session_state.all_receipts_summary
+    cache = st.session_state.get('summary_df_cache')
+    if cache is None or cache[0] is not summaries or cache[1] != len(summaries):
+        cache = (summaries, len(summaries), pd.DataFrame(summaries))
+        st.session_state.summary_df_cache = cache
+    return cache[2].copy(deep=False)
+
+# 💡 Helper function: Memoizes a value derived from the ledger until a receipt is added or the record is reset
+def ledger_memo(cache_key: str, build):
+    """Returns build(), cached in st.session_state[cache_key] for the current all_receipts_items list."""
+    items = st.session_state.all_receipts_items
+    cache = st.session_state.get(cache_key)
+    if cache is None or cache[0] is not items or cache[1] != len(items):
+        cache = (items, len(items), build())
+        st.session_state[cache_key] = cache
+    return cache[2]
+
+# 💡 Helper function: Concatenates the accumulated item frames only when they change
+def get_all_items_df() -> pd.DataFrame:
+    """Returns pd.concat of all_receipts_items, memoized in session state until a receipt is added or the record is reset."""
+    items = st.session_state.all_receipts_items
+    cache = st.session_state.get('all_items_df_cache')
+    if cache is not None and cache[0] is items and 0 < cache[1] < len(items):
+        # Receipts were only appended: extend the memoized frame with the new ones (one concat per upload)
+        st.session_state.all_items_df_cache = (items, len(items), optimize_df(pd.concat([cache[2], *items[cache[1]:]], ignore_index=True)))
+    all_items_df = ledger_memo('all_items_df_cache', lambda: optimize_df(pd.concat(items, ignore_index=True)))
+    # Shallow copy: callers add columns without touching the memoized frame
+    return all_items_df.copy(deep=False)
+
+# 💡 Helper function: Running KRW totals per AI Category, updated only with newly added receipts
+def get_category_totals() -> dict:
+    """
+    Returns {category: KRW total}; appended receipts are folded in once instead of re-grouping the whole ledger.
+    Assumes ledger frames are never mutated in place: an edited receipt must be replaced, not modified, to be re-counted.
+    """
+    items = st.session_state.all_receipts_items
+    cache = st.session_state.get('category_totals_cache')
+    if cache is None or cache[0] is not items or cache[1] > len(items):
+        cache = (items, 0, {})
+    totals = dict(cache[2])
+    for item_df in items[cache[1]:]:
+        if 'KRW Total Spend' in item_df.columns:
+            krw_spend = item_df['KRW Total Spend'].to_numpy()
+        else:
+            krw_spend = vec_to_krw(item_df['Total Spend'], item_df['Currency'], EXCHANGE_RATES)
+        for category, spend in zip(item_df['AI Category'].to_numpy(), krw_spend):
+            if category == category and spend == spend:  # skip NaN categories and NaN spend, as groupby does
+                totals[str(category)] = totals.get(str(category), 0.0) + float(spend)
+    st.session_state.category_totals_cache = (items, len(items), totals)
+    return totals
+
+# 💡 Helper function: CSV export (memoized per ledger change by ledger_memo at the call site)
+def convert_df_to_csv(df):
+    if pa is not None:
+        try:
+            buf = io.BytesIO()
+            buf.write(b"\xef\xbb\xbf")  # UTF-8 BOM so Excel reads Korean text correctly
+            # Category columns go out as plain strings so both paths write the same values
+            plain_df = df.astype({col: 'string' for col in df.select_dtypes('category').columns})
+            pacsv.write_csv(pa.Table.from_pandas(plain_df, preserve_index=False), buf)
+            return buf.getvalue()
+        except (pa.ArrowException, TypeError, ValueError):
+            pass
+    return df.to_csv(index=False).encode('utf-8-sig')
 
 # 💡 Helper function: Regenerates Summary data for imported CSVs
 def regenerate_summary_data(item_df: pd.DataFrame) -> dict:
     """Regenerates summary data from the item DataFrame for CSV import."""
     
     required_cols = ['Item Name', 'AI Category', 'KRW Total Spend']
-    if not all(col in item_df.columns for col in required_cols):
+    if set(required_cols).difference(item_df.columns):
         return None
 
     final_total_krw = item_df['KRW Total Spend'].sum()
@@ -88,7 +245,7 @@ def regenerate_summary_data(item_df: pd.DataFrame) -> dict:
     lat, lon = geocode_address("Imported Location")
     
     summary_data = {
-        'id': f"imported-{pd.Timestamp.now().timestamp()}",
+        'id': f"imported-{time.time_ns()}",
         'filename': 'Imported CSV',
         'Store': 'Imported Record',
         'Total': final_total_krw, 
@@ -104,24 +261,7 @@ def regenerate_summary_data(item_df: pd.DataFrame) -> dict:
     }
     return summary_data
 
-# 💡 Helper function: Maps sub-category to psychological category
-def get_psychological_category(sub_category: str) -> str:
-    """ Maps a detailed AI sub-category to one of the four main psychological categories. """
-    nature = SPENDING_NATURE.get(sub_category, 'Loss_Unclassified')
-    
-    if nature in ['Investment_Asset']:
-        return PSYCHOLOGICAL_CATEGORIES[0] # Investment / Asset
-    elif nature in ['Consumption_Experience', 'Consumption_Planned']:
-        return PSYCHOLOGICAL_CATEGORIES[1] # Experience / High-Value Consumption
-    elif nature in ['Impulse_Habitual', 'Impulse_Convenience', 'Loss_Inefficiency', 'Loss_Unclassified']:
-        return PSYCHOLOGICAL_CATEGORIES[2] # Habit / Impulse Loss
-    elif nature in ['Fixed_Essential']:
-        return PSYCHOLOGICAL_CATEGORIES[3] # Fixed / Essential Cost
-    else:
-        return PSYCHOLOGICAL_CATEGORIES[2] # Default to Impulse/Loss if unknown
-
-
-@st.cache_data(ttl=datetime.timedelta(hours=24))
+@st.cache_data(ttl=datetime.timedelta(hours=1))  # ExchangeRate-API refreshes hourly
 def get_exchange_rates():
     """
     Fetches real-time exchange rates using ExchangeRate-API (USD Base).
@@ -134,9 +274,9 @@ def get_exchange_rates():
     exchange_rates = {'KRW': 1.0} 
 
     try:
-        response = requests.get(url, timeout=10)
+        response = get_http_session().get(url, timeout=10)
         response.raise_for_status() 
-        data = response.json()
+        data = json_loads(response.content)
         conversion_rates = data.get('conversion_rates', {})
         
         # 1. KRW Rate (USD -> KRW) extraction
@@ -180,6 +320,15 @@ def convert_to_krw(amount: float, currency: str, rates: dict) -> float:
         
     return amount * rate
 
+
+# 💡 Helper function: Vectorized convert_to_krw for whole columns (same fallback rules)
+def vec_to_krw(amounts: pd.Series, currencies: pd.Series, rates: dict) -> np.ndarray:
+    """ Converts a column of amounts to KRW in one NumPy multiply instead of a per-row apply. """
+    rate_series = currencies.astype(str).str.upper().str.strip().map(rates).fillna(rates.get('KRW', 1.0))
+    rate_array = rate_series.to_numpy(dtype=np.float64)
+    rate_array = np.where(rate_array == 0, rates.get('USD', 1300), rate_array)
+    return pd.to_numeric(amounts, errors='coerce').fillna(0).to_numpy(dtype=np.float64) * rate_array
+
 # Global Categories (Internal classification names remain Korean for consistency with AI analysis prompt)
 ALL_CATEGORIES = [
     "Dining Out", "Casual Dining", "Coffee & Beverages", "Alcohol & Bars", 
@@ -191,14 +340,7 @@ ALL_CATEGORIES = [
     "Movies & Shows", "Travel & Accommodation", "Games & Digital Goods", 
     "Events & Gifts", "Fees & Penalties", "Rent & Mortgage", "Unclassified"
 ]
-
-# The four main categories for the final analysis report.
-PSYCHOLOGICAL_CATEGORIES = [
-    "Investment / Asset", 
-    "Experience / High-Value Consumption", 
-    "Habit / Impulse Loss", 
-    "Fixed / Essential Cost"
-]
+CATEGORY_DTYPE = pd.CategoricalDtype(categories=ALL_CATEGORIES)  # Shared dtype keeps 'AI Category' categorical across pd.concat
 
 # --- New Global Variable for Psychological Analysis ---
 # Maps the detailed sub-category to its primary psychological spending nature.
@@ -264,6 +406,15 @@ def get_psychological_category(sub_category: str) -> str:
         return PSYCHOLOGICAL_CATEGORIES[2] # Default to Impulse/Loss if unknown
 
 
+# Sub-category -> psychological category lookup, folded once at import so per-row work is a dict lookup.
+SUB_TO_PSYCH = {sub: get_psychological_category(sub) for sub in SPENDING_NATURE}
+
+
+def map_psychological_category(sub_categories: pd.Series) -> pd.Series:
+    """ Vectorized get_psychological_category(): unknown sub-categories fall back to Habit / Impulse Loss. """
+    return sub_categories.map(SUB_TO_PSYCH).astype(object).fillna(PSYCHOLOGICAL_CATEGORIES[2])
+
+
 def get_category_guide():
     # 💡 Updated category guide in English
     guide = ""
@@ -287,6 +438,12 @@ if 'all_receipts_summary' not in st.session_state:
     st.session_state.all_receipts_summary = []
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
+if 'pending_analyses' not in st.session_state:
+    st.session_state.pending_analyses = {}
+if 'receipt_results' not in st.session_state:
+    st.session_state.receipt_results = {}  # file_id -> analysis JSON awaiting "Save to Ledger"
+if 'receipt_edits' not in st.session_state:
+    st.session_state.receipt_edits = {}  # file_id -> edited AI Category list for that review
 
 
 st.set_page_config(
@@ -323,17 +480,12 @@ st.markdown("---")
 EXCHANGE_RATES = get_exchange_rates()
 
 
-# --- 1. Gemini Analysis Function (Prompt Remains English) ---
-def analyze_receipt_with_gemini(_image: Image.Image):
-    """
-    Calls the Gemini model to extract data and categorize items from a receipt image.
-    (Function body omitted for brevity, assumed correct)
-    """
-    prompt_template = """
+# 📢 Static receipt-analysis prompt, built once at import instead of on every call
+ANALYZE_RECEIPT_PROMPT = """
     You are an expert in receipt analysis and ledger recording.
     Analyze the following items from the receipt image and **you must extract them in JSON format**.
     
-    **CRITICAL INSTRUCTION:** The response must only contain the **JSON code block wrapped in backticks (```json)**. Do not include any explanations, greetings, or additional text outside the JSON code block.
+    **CRITICAL INSTRUCTION:** The response must only contain the JSON object. Do not include any explanations, greetings, or additional text.
     
     1. store_name: Store Name (text)
     2. date: Date (YYYY-MM-DD format). **If not found, use YYYY-MM-DD format based on today's date.**
@@ -355,7 +507,6 @@ def analyze_receipt_with_gemini(_image: Image.Image):
     - **IMPULSE / LOSS:** Casual Dining, Coffee & Beverages, Alcohol & Bars, Games & Digital Goods, Taxi Convenience, Fees & Penalties, Unclassified
         
     JSON Schema:
-    ```json
     {
       "store_name": "...",
       "date": "...",
@@ -370,33 +521,139 @@ def analyze_receipt_with_gemini(_image: Image.Image):
       ]
     }
     """
-    
-    try:
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=[prompt_template, _image],
-            config=genai.types.GenerateContentConfig(
-                safety_settings=[
-                    {"category": HarmCategory.HARM_CATEGORY_HARASSMENT, "threshold": HarmBlockThreshold.BLOCK_NONE},
-                ]
-            )
-        )
-        return response.text
-    
-    except Exception as e:
-        st.error(f"Gemini API call failed: {e}")
-        return None
 
-# --- 2. AI Analysis Report Generation Function (English remains unchanged) ---
 
-def generate_ai_analysis(summary_df: pd.DataFrame, store_name: str, total_amount: float, currency_unit: str, detailed_items_text: str):
+# 📢 Structured output schema: Gemini returns raw JSON matching this shape (no markdown fence to strip)
+class ReceiptItem(BaseModel):
+    name: str
+    price: float
+    quantity: float
+    category: str
+
+
+class ReceiptAnalysis(BaseModel):
+    store_name: str
+    date: str
+    store_location: str
+    total_amount: float
+    tax_amount: float
+    tip_amount: float
+    discount_amount: float
+    currency_unit: str
+    items: list[ReceiptItem]
+
+
+# 💡 Helper function: Shrinks phone photos before upload (OCR accuracy plateaus well below 12 MP)
+RECEIPT_MAX_EDGE = 1600
+
+def prepare_receipt_image(image_bytes: bytes) -> genai.types.Part:
+    """Resizes the receipt to a max edge of RECEIPT_MAX_EDGE px and re-encodes it as JPEG (quality 85)."""
+    image = Image.open(io.BytesIO(image_bytes))
+    if max(image.size) <= RECEIPT_MAX_EDGE and image.format == 'JPEG':
+        # Already small and JPEG: send the original bytes untouched
+        return genai.types.Part.from_bytes(data=image_bytes, mime_type='image/jpeg')
+    image = ImageOps.exif_transpose(image)  # Re-encoding drops EXIF, so bake the camera orientation into the pixels
+    image.thumbnail((RECEIPT_MAX_EDGE, RECEIPT_MAX_EDGE), Image.Resampling.LANCZOS)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    buf = io.BytesIO()
+    image.save(buf, format='JPEG', quality=85, optimize=True)
+    return genai.types.Part.from_bytes(data=buf.getvalue(), mime_type='image/jpeg')
+
+
+# 💡 Helper function: Small preview for the uploader column, decoded once per image instead of on every rerun
+RECEIPT_PREVIEW_EDGE = 800
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def make_receipt_preview(image_digest: str, _image_bytes: bytes) -> bytes:
+    """Returns a JPEG thumbnail (max edge RECEIPT_PREVIEW_EDGE px) of the receipt for on-screen display."""
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(_image_bytes)))
+    image.thumbnail((RECEIPT_PREVIEW_EDGE, RECEIPT_PREVIEW_EDGE), Image.Resampling.LANCZOS)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    buf = io.BytesIO()
+    image.save(buf, format='JPEG', quality=85)
+    return buf.getvalue()
+
+
+# --- 1. Gemini Analysis Function (Prompt Remains English) ---
+@st.cache_data(persist="disk", show_spinner=False)
+def _analyze_receipt_bytes(image_digest: str, _image_bytes: bytes) -> str:
     """
-    Generates an AI analysis report based on aggregated spending data and detailed items.
+    Calls the Gemini model on the raw receipt image and returns the response text.
+    Cached on the BLAKE2b digest of the image bytes (persisted to disk), so a receipt that was
+    already analyzed never hits the API again. Errors are raised, so failures are not cached.
     """
-    # [Function body omitted for brevity, assumed correct]
-    summary_text = summary_df.to_string(index=False)
+    response = client.models.generate_content(
+        model='gemini-2.5-flash',
+        contents=[ANALYZE_RECEIPT_PROMPT, prepare_receipt_image(_image_bytes)],
+        config=genai.types.GenerateContentConfig(
+            safety_settings=[
+                {"category": HarmCategory.HARM_CATEGORY_HARASSMENT, "threshold": HarmBlockThreshold.BLOCK_NONE},
+            ],
+            response_mime_type='application/json',
+            response_schema=ReceiptAnalysis,
+        )
+    )
+    if not response.text:
+        raise ValueError("Gemini returned an empty response.")
+    return response.text
+
 
-    prompt_template = f"""
+def analyze_receipt_async(image_bytes: bytes, image_digest: str = None) -> Future:
+    """
+    Starts the Gemini receipt analysis on the shared pool and returns its Future,
+    so several receipts can be read concurrently while the script waits on one.
+    """
+    if image_digest is None:
+        image_digest = hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+    return submit_with_ctx(_analyze_receipt_bytes, image_digest, image_bytes)
+
+
+# 💡 Helper function: Status label for the receipt selector
+def receipt_status(receipt_id: str) -> str:
+    """Short status label for an uploaded receipt in the review selector."""
+    if find_summary_by_id(receipt_id) is not None:
+        return "✅ Saved"
+    result = st.session_state.receipt_results.get(receipt_id)
+    if isinstance(result, Exception):
+        return "❌ Failed"
+    if result is not None:
+        return "📝 Ready to review"
+    if receipt_id in st.session_state.pending_analyses:
+        return "⏳ Analyzing"
+    return "New"
+
+
+# 💡 Helper function: Moves finished background analyses into receipt_results
+def harvest_analyses() -> bool:
+    """
+    Stores each finished analysis (response text, or the exception if the API call failed) in receipt_results
+    before dropping its future from pending_analyses. Returns True if any analysis finished.
+    """
+    pending_analyses = st.session_state.pending_analyses
+    finished_ids = [receipt_id for receipt_id, future in pending_analyses.items() if future.done()]
+    for receipt_id in finished_ids:
+        future = pending_analyses[receipt_id]
+        error = future.exception()
+        if error is None and not future.result():
+            error = ValueError("Gemini returned an empty response.")
+        st.session_state.receipt_results[receipt_id] = future.result() if error is None else error
+        del pending_analyses[receipt_id]
+    return bool(finished_ids)
+
+
+# 💡 Helper function: Non-blocking wait on background analyses; only this fragment reruns until one finishes
+@st.fragment(run_every=2)
+def watch_pending_analyses():
+    """Checks the pending analyses every 2 seconds and reruns the whole app (refreshing the selector statuses) once any of them finishes."""
+    if harvest_analyses():
+        st.rerun()
+    st.caption(f"⏳ {len(st.session_state.pending_analyses)} receipt analysis(es) running in the background...")
+
+
+# 📢 Report prompt template, filled with .format() per call
+REPORT_PROMPT_FMT = """
     You are a supportive, friendly, and highly knowledgeable Financial Psychologist and Advisor. Your role is to analyze the user's spending habits from a **psychological and behavioral economics perspective**, and provide personalized advice on overcoming impulse spending and optimizing happiness per won. Your tone should be consistently polite and helpful, like a professional mentor.
 
     The user's **all accumulated spending** amounts to {total_amount:,.0f} {currency_unit}.
@@ -417,6 +674,22 @@ def generate_ai_analysis(summary_df: pd.DataFrame, store_name: str, total_amount
     3. The response must only contain the analysis content, starting directly with the summary, without any greetings or additional explanations.
     4. **CRITICAL:** When mentioning the total spending amount in the analysis, **you must include the currency unit** (e.g., "Total spending of 1,500,000 KRW").
     """
+
+# --- 2. AI Analysis Report Generation Function (English remains unchanged) ---
+
+def generate_ai_analysis(summary_df: pd.DataFrame, store_name: str, total_amount: float, currency_unit: str, detailed_items_text: str):
+    """
+    Generates an AI analysis report based on aggregated spending data and detailed items.
+    """
+    # [Function body omitted for brevity, assumed correct]
+    summary_text = summary_df.to_csv(index=False, sep='|')
+
+    prompt_template = REPORT_PROMPT_FMT.format(
+        total_amount=total_amount,
+        currency_unit=currency_unit,
+        summary_text=summary_text,
+        detailed_items_text=detailed_items_text,
+    )
     
     try:
         response = client.models.generate_content(
@@ -428,15 +701,8 @@ def generate_ai_analysis(summary_df: pd.DataFrame, store_name: str, total_amount
     except Exception as e:
         return "Failed to generate analysis report."
 
-# 📢 [NEW] Chat Summary Function
-def generate_chat_summary(chat_history: list, total_spent: float, impulse_index: float, high_impulse_cat: str) -> str:
-    """
-    Calls the Gemini model to summarize the main financial advice and alternatives from the chat history.
-    """
-    
-    history_text = "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in chat_history])
-
-    prompt_template = f"""
+# 📢 Chat summary prompt template, filled with .format() per call
+CHAT_SUMMARY_PROMPT_FMT = """
     You are summarizing a financial consultation transcript.
     The user's spending profile: Total Spent {total_spent:,.0f} KRW, Impulse Index {impulse_index:.2f}, Highest Impulse Category '{high_impulse_cat}'.
     
@@ -450,18 +716,96 @@ def generate_chat_summary(chat_history: list, total_spent: float, impulse_index:
     {history_text}
     ---
     """
+
+# 💡 Helper function: Chat summary text cached on the filled prompt (transcript + metrics)
+@st.cache_data(ttl=datetime.timedelta(hours=1), show_spinner=False)
+def _generate_chat_summary_text(prompt_template: str) -> str:
+    """
+    Calls Gemini for the PDF chat summary. Reruns with an unchanged transcript and metrics reuse the previous text.
+    Errors are raised, so failures are not cached.
+    """
+    response = client.models.generate_content(
+        model='gemini-2.5-flash',
+        contents=[prompt_template],
+    )
+    if not response.text:
+        raise ValueError("Gemini returned an empty response.")
+    return response.text
+
+
+# 📢 [NEW] Chat Summary Function
+def generate_chat_summary(chat_history: list, total_spent: float, impulse_index: float, high_impulse_cat: str) -> str:
+    """
+    Calls the Gemini model to summarize the main financial advice and alternatives from the chat history.
+    """
+    
+    history_text = "\n".join(f"{msg['role'].capitalize()}: {msg['content']}" for msg in chat_history)
+
+    prompt_template = CHAT_SUMMARY_PROMPT_FMT.format(
+        total_spent=total_spent,
+        impulse_index=impulse_index,
+        high_impulse_cat=high_impulse_cat,
+        history_text=history_text,
+    )
     
     try:
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=[prompt_template],
-        )
-        return response.text
+        return _generate_chat_summary_text(prompt_template)
         
     except Exception as e:
         return "Failed to generate chat summary report due to an AI processing error."
 
 
+CHAT_WINDOW_MESSAGES = 8    # Most recent chat messages always sent verbatim
+CHAT_COMPRESS_AFTER = 16    # Fold older messages into the rolling summary once this many are unsummarized
+
+# 📢 Rolling chat-memory prompt, filled with .format() when older turns are compressed
+CHAT_COMPRESS_PROMPT_FMT = """
+    Condense the earlier part of a financial consultation into a short memo (about 120 tokens).
+    Keep the user's stated goals, concerns, and any advice or alternatives already given. Omit greetings.
+
+    --- Previous Memo ---
+    {previous_summary}
+    --- New Messages ---
+    {history_text}
+    ---
+    """
+
+# 💡 Helper function: Bounded chat context (rolling summary + recent messages)
+def build_chat_contents(chat_history: list) -> list:
+    """Returns Gemini contents: a summary of older turns plus the last CHAT_WINDOW_MESSAGES messages verbatim."""
+    memo = st.session_state.get('chat_memory')
+    if memo is None or memo[0] is not chat_history or memo[1] > len(chat_history):
+        memo = (chat_history, 0, "")
+    _, summarized_upto, summary = memo
+    
+    if len(chat_history) - summarized_upto > CHAT_COMPRESS_AFTER:
+        cut = len(chat_history) - CHAT_WINDOW_MESSAGES
+        history_text = "\n".join(f"{msg['role'].capitalize()}: {msg['content']}" for msg in chat_history[summarized_upto:cut])
+        try:
+            response = client.models.generate_content(
+                model='gemini-2.5-flash',
+                contents=[CHAT_COMPRESS_PROMPT_FMT.format(previous_summary=summary or "None", history_text=history_text)],
+            )
+            if response.text:
+                summarized_upto, summary = cut, response.text
+        except Exception:
+            pass  # Send the uncompressed tail this turn; compression is retried on the next message
+    st.session_state.chat_memory = (chat_history, summarized_upto, summary)
+    
+    contents = []
+    for item in chat_history[summarized_upto:]:
+        gemini_role = "user" if item["role"] == "user" else "model"
+        contents.append({"role": gemini_role, "parts": [{"text": item["content"]}]})
+    if summary:
+        # Merged into the window's first user turn so two user turns never run back to back
+        summary_part = {"text": "Prior conversation summary: " + summary}
+        if contents and contents[0]["role"] == "user":
+            contents[0]["parts"].insert(0, summary_part)
+        else:
+            contents.insert(0, {"role": "user", "parts": [summary_part]})
+    return contents
+
+
 # 📢 [NEW] PDF 생성 클래스 (fpdf2 기반)
 class PDF(FPDF):
     def header(self):
@@ -501,30 +845,138 @@ class PDF(FPDF):
 
         # Data rows
         self.set_font('Nanum', '', 8)
-        for _, row in data.iterrows():
-            row_list = [str(item) for item in row.iloc[:len(header_titles)]]
-            
+        # itertuples yields plain tuples (no per-row Series) and keeps each column's dtype
+        for row in data.iloc[:, :num_cols].itertuples(index=False, name=None):
             # Truncate content for table layout
-            row_list = [item[:25] if len(item) > 25 else item for item in row_list]
+            row_list = [str(item)[:25] for item in row]
             
             for i, item in enumerate(row_list):
                 self.cell(col_width, 6, item, 1, 0, 'C')
             self.ln()
 
 
+NANUM_FONT_FILES = {'': 'fonts/NanumGothic.ttf', 'B': 'fonts/NanumGothicBold.ttf'}
+
+
+# 📢 Font bytes are read from disk once per process, not on every PDF export
+@st.cache_resource
+def load_nanum_font_bytes() -> dict:
+    """Reads the Nanum font files into memory once; missing files are skipped."""
+    font_bytes = {}
+    for style, path in NANUM_FONT_FILES.items():
+        try:
+            with open(path, 'rb') as f:
+                font_bytes[style] = f.read()
+        except OSError:
+            pass
+    return font_bytes
+
+
+def add_nanum_fonts(pdf_instance):
+    """Registers Nanum fonts on a PDF from the preloaded bytes. Raises if a font cannot be added."""
+    font_bytes = load_nanum_font_bytes()
+    for style, path in NANUM_FONT_FILES.items():
+        if style in font_bytes:
+            try:
+                pdf_instance.add_font('Nanum', style, io.BytesIO(font_bytes[style]))
+                continue
+            except Exception:
+                pass  # Older fpdf2 only accepts a file path
+        pdf_instance.add_font('Nanum', style, path, uni=True)
+
+
 # 📢 [FIX] Removed cache decorator
 def register_pdf_fonts(pdf_instance):
     """Registers Nanum fonts with FPDF, returns False if failed."""
     # 📢 [FIX] Removed cache decorator to prevent UnhashableParamError
     try:
          # Uses relative path from app root/fonts folder
-         pdf_instance.add_font('Nanum', '', 'fonts/NanumGothic.ttf', uni=True) 
-         pdf_instance.add_font('Nanum', 'B', 'fonts/NanumGothicBold.ttf', uni=True)
+         add_nanum_fonts(pdf_instance)
          return True
     except Exception as e:
          return False 
 
 
+# 💡 Helper function: Category review for a freshly analyzed receipt; editor changes rerun only this fragment
+@st.fragment
+def render_item_review(items_df: pd.DataFrame, display_unit: str, tax_amount: float, tip_amount: float, geo_future: Future, receipt_info: dict):
+    """Shows the editable item table and appends the receipt to the ledger when "Save to Ledger" is clicked."""
+    st.subheader("🛒 Detailed Item Breakdown (Category Editable)")
+
+    editor_df = items_df.drop(columns=['Total Spend Original', 'Discount Applied', 'Total Spend'])
+    # Always a plain-string column, so the keyed editor keeps the same identity across reruns
+    ai_categories = editor_df['AI Category'].astype(str).tolist()
+    editor_df['AI Category'] = ai_categories
+    saved_categories = st.session_state.receipt_edits.get(receipt_info['id'])
+    if saved_categories is not None:  # Restore edits made before a full rerun or a switch to another receipt
+        editor_df['AI Category'] = saved_categories
+    edited_df = st.data_editor(
+        editor_df, 
+        column_config={
+            "AI Category": st.column_config.SelectboxColumn(
+                "Final Category",
+                help="Select the correct sub-category for this item.",
+                width="medium",
+                options=ALL_CATEGORIES,
+                required=True,
+            ),
+        },
+        disabled=['Item Name', 'Unit Price', 'Quantity'], 
+        hide_index=True,
+        use_container_width=True,
+        key=f"item_editor_{receipt_info['id']}"
+    )
+    edited_categories = edited_df['AI Category'].tolist()
+    if edited_categories != ai_categories:
+        st.session_state.receipt_edits[receipt_info['id']] = edited_categories
+    else:
+        st.session_state.receipt_edits.pop(receipt_info['id'], None)
+
+    if not st.button("💾 Save to Ledger", key=f"save_receipt_{receipt_info['id']}"):
+        st.caption("Adjust the categories if needed, then save this receipt to the ledger.")
+        return
+    if find_summary_by_id(receipt_info['id']) is not None:
+        return  # Already saved (e.g. a double click)
+
+    edited_df['Total Spend'] = items_df['Total Spend']
+
+    # 📢 Currency Conversion for Accumulation (AI Analysis)
+    edited_df['Currency'] = display_unit
+    edited_df['Total Spend Numeric'] = pd.to_numeric(edited_df['Total Spend'], errors='coerce').fillna(0)
+    edited_df['KRW Total Spend'] = vec_to_krw(edited_df['Total Spend Numeric'], edited_df['Currency'], EXCHANGE_RATES)
+    edited_df = edited_df.drop(columns=['Total Spend Numeric'])
+
+    krw_tax_total = convert_to_krw(tax_amount, display_unit, EXCHANGE_RATES) 
+    krw_tip_total = convert_to_krw(tip_amount, display_unit, EXCHANGE_RATES)
+
+    lat, lon = geo_future.result()
+
+    # ** Accumulate Data: Store the edited DataFrame **
+    st.session_state.all_receipts_items.append(optimize_df(edited_df))
+
+    final_total_krw = edited_df['KRW Total Spend'].sum() + krw_tip_total
+
+    st.session_state.all_receipts_summary.append({
+        'id': receipt_info['id'], 
+        'filename': receipt_info['filename'],
+        'Store': receipt_info['Store'],
+        'Total': final_total_krw, 
+        'Tax_KRW': krw_tax_total, 
+        'Tip_KRW': krw_tip_total, 
+        'Currency': 'KRW', 
+        'Date': receipt_info['Date'], 
+        'Location': receipt_info['Location'], 
+        'Original_Total': receipt_info['Original_Total'], 
+        'Original_Currency': display_unit,
+        'latitude': lat,
+        'longitude': lon
+    })
+
+    st.session_state.receipt_results.pop(receipt_info['id'], None)
+    st.session_state.receipt_edits.pop(receipt_info['id'], None)
+    st.rerun()  # Full rerun: the cumulative report picks up the new receipt
+
+
 # ----------------------------------------------------------------------
 # 📌 4. Streamlit UI: Tab Setup (Translated)
 # ----------------------------------------------------------------------
@@ -561,14 +1013,18 @@ with tab1:
             st.session_state.csv_load_triggered = False 
             
             try:
-                imported_df = pd.read_csv(uploaded_csv_file)
+                # Validate the header row before reading the body, so bad uploads are rejected cheaply
+                header_cols = pd.read_csv(uploaded_csv_file, nrows=0).columns
+                uploaded_csv_file.seek(0)
                 
                 required_cols = ['Item Name', 'Unit Price', 'Quantity', 'AI Category', 'Total Spend', 'Currency', 'KRW Total Spend']
+                missing_cols = set(required_cols).difference(header_cols)
                 
-                if not all(col in imported_df.columns for col in required_cols):
+                if missing_cols:
                     st.error("❌ Uploaded CSV file is missing required columns. Please upload a correctly formatted file.")
                 else:
-                    st.session_state.all_receipts_items.append(imported_df)
+                    imported_df = pd.read_csv(uploaded_csv_file)
+                    st.session_state.all_receipts_items.append(optimize_df(imported_df))
                     
                     summary_data = regenerate_summary_data(imported_df)
                     if summary_data:
@@ -584,28 +1040,60 @@ with tab1:
     # 2. Image Upload Section (Right Column)
     with col_img:
         st.markdown("**Upload Receipt Image (AI Analysis)**")
-        uploaded_file = st.file_uploader(
-            "Upload one receipt image (jpg, png) at a time.", 
+        uploaded_files = st.file_uploader(
+            "Upload receipt images (jpg, png). Several receipts are analyzed in parallel.", 
             type=['jpg', 'png', 'jpeg'],
-            accept_multiple_files=False,
+            accept_multiple_files=True,
             key='receipt_uploader' 
-        )
+        ) or []
+        
+        # 📢 Content ids: renamed re-uploads are still caught
+        receipt_ids = [hashlib.blake2b(receipt.getvalue(), digest_size=16).hexdigest() for receipt in uploaded_files]
+        pending_analyses = st.session_state.pending_analyses
+        receipt_results = st.session_state.receipt_results
+
+        # Forget analyses of receipts that were removed from the uploader
+        current_ids = set(receipt_ids)
+        for state_key in ('pending_analyses', 'receipt_results', 'receipt_edits'):
+            stored = st.session_state[state_key]
+            for stale_id in stored.keys() - current_ids:
+                del stored[stale_id]
+
+        # Finished analyses are kept as results so they survive switching receipts
+        harvest_analyses()
+
+        selected_index = 0
+        if len(uploaded_files) > 1:
+            # 📢 Submit every new receipt to the shared pool at once; each one is then reviewed below
+            if st.button(f"✨ Analyze All {len(uploaded_files)} Receipts"):
+                for receipt, receipt_id in zip(uploaded_files, receipt_ids):
+                    # Failed analyses are resubmitted; results awaiting review are left alone
+                    if find_summary_by_id(receipt_id) is None and receipt_id not in pending_analyses and not isinstance(receipt_results.get(receipt_id), str):
+                        receipt_results.pop(receipt_id, None)
+                        pending_analyses[receipt_id] = analyze_receipt_async(receipt.getvalue(), receipt_id)
+            selected_index = st.selectbox(
+                "Receipt to review",
+                range(len(uploaded_files)),
+                format_func=lambda i: f"{uploaded_files[i].name} · {receipt_status(receipt_ids[i])}",
+                key='receipt_review_select'
+            )
+        uploaded_file = uploaded_files[selected_index] if uploaded_files else None
 
 
     st.markdown("---")
     # --- 📢 [NEW] CSV/Image Upload Section End ---
 
     if uploaded_file is not None:
-        file_id = f"{uploaded_file.name}-{uploaded_file.size}"
+        receipt_bytes = uploaded_file.getvalue()
+        file_id = receipt_ids[selected_index]
         
-        existing_summary = next((s for s in st.session_state.all_receipts_summary if s.get('id') == file_id), None)
+        existing_summary = find_summary_by_id(file_id)
         is_already_analyzed = existing_summary is not None
         
         col1, col2 = st.columns(2)
         with col1:
             st.subheader("🖼️ Uploaded Receipt")
-            image = Image.open(uploaded_file)
-            st.image(image, use_container_width=True) 
+            st.image(make_receipt_preview(file_id, receipt_bytes), use_container_width=True) 
 
         with col2:
             st.subheader("📊 Analysis and Recording")
@@ -637,173 +1125,134 @@ with tab1:
                 analyze_button = st.button("✨ Start Receipt Analysis")
 
 
-            if analyze_button and not is_already_analyzed:
-                
-                st.info("💡 Starting Gemini analysis. This may take 10-20 seconds.")
-                with st.spinner('AI is reading the receipt...'):
-                    
-                    json_data_text = analyze_receipt_with_gemini(image)
+            if analyze_button and not is_already_analyzed and file_id not in pending_analyses:
+                st.session_state.receipt_results.pop(file_id, None)  # A new attempt replaces a failed one
+                pending_analyses[file_id] = analyze_receipt_async(receipt_bytes, file_id)
 
-                    if json_data_text:
-                        try:
-                            # JSON Cleaning Logic
-                            cleaned_text = json_data_text.strip()
-                            if cleaned_text.startswith("```json"):
-                                cleaned_text = cleaned_text.lstrip("```json")
-                            if cleaned_text.endswith("```"):
-                                cleaned_text = cleaned_text.rstrip("```")
-                            
-                            receipt_data = json.loads(cleaned_text.strip()) 
+            if file_id in pending_analyses and not is_already_analyzed:
+                st.info("💡 AI is reading the receipt. This may take 10-20 seconds; the review appears here when it is done.")
+
+            if pending_analyses:
+                # Polls in a fragment, so the page stays usable while Gemini works
+                watch_pending_analyses()
+
+            # 📢 Kept until "Save to Ledger" so later reruns still show the review
+            json_data_text = st.session_state.receipt_results.get(file_id)
+            if isinstance(json_data_text, Exception) and not is_already_analyzed:
+                st.error(f"Gemini API call failed: {json_data_text}. Please try again.")
+            elif json_data_text is not None and not is_already_analyzed:
+                try:
+                    # JSON mode: the response text is the bare JSON object
+                    receipt_data = json_loads(json_data_text)
                             
-                            # Data Validation and Defaults
-                            total_amount = safe_get_amount(receipt_data, 'total_amount')
-                            tax_amount = safe_get_amount(receipt_data, 'tax_amount')
-                            tip_amount = safe_get_amount(receipt_data, 'tip_amount')
-                            discount_amount = safe_get_amount(receipt_data, 'discount_amount')
+                    # Data Validation and Defaults
+                    total_amount = safe_get_amount(receipt_data, 'total_amount')
+                    tax_amount = safe_get_amount(receipt_data, 'tax_amount')
+                    tip_amount = safe_get_amount(receipt_data, 'tip_amount')
+                    discount_amount = safe_get_amount(receipt_data, 'discount_amount')
                             
-                            currency_unit = receipt_data.get('currency_unit', '').strip()
-                            display_unit = currency_unit if currency_unit else 'KRW'
+                    currency_unit = receipt_data.get('currency_unit', '').strip()
+                    display_unit = currency_unit if currency_unit else 'KRW'
                             
-                            receipt_date_str = receipt_data.get('date', '').strip()
-                            store_location_str = receipt_data.get('store_location', '').strip()
+                    receipt_date_str = receipt_data.get('date', '').strip()
+                    store_location_str = receipt_data.get('store_location', '').strip()
                             
-                            try:
-                                date_object = pd.to_datetime(receipt_date_str, format='%Y-%m-%d', errors='raise').date()
-                                final_date = date_object.strftime('%Y-%m-%d')
-                            except (ValueError, TypeError):
-                                final_date = datetime.date.today().strftime('%Y-%m-%d')
-                                st.warning("⚠️ AI date recognition failed, defaulting to today's date.")
+                    try:
+                        date_object = pd.to_datetime(receipt_date_str, format='%Y-%m-%d', errors='raise').date()
+                        final_date = date_object.strftime('%Y-%m-%d')
+                    except (ValueError, TypeError):
+                        final_date = datetime.date.today().strftime('%Y-%m-%d')
+                        st.warning("⚠️ AI date recognition failed, defaulting to today's date.")
                                 
-                            final_location = store_location_str if store_location_str else "Seoul"
+                    final_location = store_location_str if store_location_str else "Seoul"
+                    geo_future = geocode_address_async(final_location)
 
                             
-                            # --- Amount Validation and Override ---
-                            if 'items' in receipt_data and receipt_data['items']:
-                                items_df = pd.DataFrame(receipt_data['items'])
+                    # --- Amount Validation and Override ---
+                    if 'items' in receipt_data and receipt_data['items']:
+                        # Parse price/quantity straight from the JSON list into NumPy arrays
+                        items = receipt_data['items']
+                        unit_prices = np.fromiter((safe_get_amount(item, 'price', 0.0) for item in items), dtype=np.float64, count=len(items))
+                        quantities = np.fromiter((safe_get_amount(item, 'quantity', 1.0) for item in items), dtype=np.float64, count=len(items))
+                        item_totals = unit_prices * quantities
                                 
-                                items_df.columns = ['Item Name', 'Unit Price', 'Quantity', 'AI Category']
-                                items_df['Unit Price'] = pd.to_numeric(items_df['Unit Price'], errors='coerce').fillna(0)
-                                items_df['Quantity'] = pd.to_numeric(items_df['Quantity'], errors='coerce').fillna(1)
+                        items_df = pd.DataFrame({
+                            'Item Name': [item.get('name', '') for item in items],
+                            'Unit Price': unit_prices,
+                            'Quantity': quantities,
+                            'AI Category': [item.get('category', 'Unclassified') for item in items],  # Plain strings; optimize_df applies CATEGORY_DTYPE at save time
+                        })
                                 
-                                calculated_original_total = (items_df['Unit Price'] * items_df['Quantity']).sum()
-                                total_discount = safe_get_amount(receipt_data, 'discount_amount') 
+                        calculated_original_total = item_totals.sum()
+                        total_discount = safe_get_amount(receipt_data, 'discount_amount') 
                                 
-                                calculated_final_total = calculated_original_total - total_discount
+                        calculated_final_total = calculated_original_total - total_discount
                                 
-                                if abs(calculated_final_total - total_amount) > 100 and calculated_final_total > 0:
-                                    st.warning(
-                                        f"⚠️ AI total ({total_amount:,.0f} {display_unit}) differs significantly from item sum ({calculated_final_total:,.0f} {display_unit}). "
-                                        f"**Overriding total with item sum.**"
-                                    )
-                                    total_amount = calculated_final_total
+                        if abs(calculated_final_total - total_amount) > 100 and calculated_final_total > 0:
+                            st.warning(
+                                f"⚠️ AI total ({total_amount:,.0f} {display_unit}) differs significantly from item sum ({calculated_final_total:,.0f} {display_unit}). "
+                                f"**Overriding total with item sum.**"
+                            )
+                            total_amount = calculated_final_total
                                 
                                 
-                                # --- Main Information Display ---
-                                st.success("✅ Analysis Complete! Check the ledger data below.")
+                        # --- Main Information Display ---
+                        st.success("✅ Analysis Complete! Check the ledger data below.")
                                 
-                                st.markdown(f"**🏠 Store Name:** {receipt_data.get('store_name', 'N/A')}")
-                                st.markdown(f"**📍 Location:** {final_location}") 
-                                st.markdown(f"**📅 Date:** {final_date}") 
-                                st.subheader(f"💰 Total Amount Paid (Corrected): {total_amount:,.0f} {display_unit}")
-
-                                if discount_amount > 0:
-                                    discount_display = f"{discount_amount:,.2f} {display_unit}"
-                                    st.markdown(f"**🎁 Total Discount:** {discount_display}") 
-
-                                if tax_amount > 0 or tip_amount > 0:
-                                    tax_display = f"{tax_amount:,.2f} {display_unit}"
-                                    tip_display = f"{tip_amount:,.2f} {display_unit}"
-                                    st.markdown(f"**🧾 Tax/VAT:** {tax_display} | **💸 Tip:** {tip_display}")
+                        st.markdown(f"**🏠 Store Name:** {receipt_data.get('store_name', 'N/A')}")
+                        st.markdown(f"**📍 Location:** {final_location}") 
+                        st.markdown(f"**📅 Date:** {final_date}") 
+                        st.subheader(f"💰 Total Amount Paid (Corrected): {total_amount:,.0f} {display_unit}")
+
+                        if discount_amount > 0:
+                            discount_display = f"{discount_amount:,.2f} {display_unit}"
+                            st.markdown(f"**🎁 Total Discount:** {discount_display}") 
+
+                        if tax_amount > 0 or tip_amount > 0:
+                            tax_display = f"{tax_amount:,.2f} {display_unit}"
+                            tip_display = f"{tip_amount:,.2f} {display_unit}"
+                            st.markdown(f"**🧾 Tax/VAT:** {tax_display} | **💸 Tip:** {tip_display}")
                                 
-                                if display_unit != 'KRW':
-                                    applied_rate = EXCHANGE_RATES.get(display_unit, 1.0)
-                                    st.info(f"**📢 Applied Exchange Rate:** 1 {display_unit} = {applied_rate:,.4f} KRW (Rate fetched from API/Fallback)")
+                        if display_unit != 'KRW':
+                            applied_rate = EXCHANGE_RATES.get(display_unit, 1.0)
+                            st.info(f"**📢 Applied Exchange Rate:** 1 {display_unit} = {applied_rate:,.4f} KRW (Rate fetched from API/Fallback)")
                                     
-                                st.markdown("---")
+                        st.markdown("---")
 
-                                # 📢 Discount Allocation Logic
-                                items_df['Total Spend Original'] = items_df['Unit Price'] * items_df['Quantity']
-                                items_df['Discount Applied'] = 0.0
-                                items_df['Total Spend'] = items_df['Total Spend Original']
+                        # 📢 Discount Allocation Logic
+                        items_df['Total Spend Original'] = item_totals
+                        items_df['Discount Applied'] = 0.0
+                        items_df['Total Spend'] = item_totals
                                 
-                                total_item_original = items_df['Total Spend Original'].sum()
+                        total_item_original = calculated_original_total
                                 
-                                if total_discount > 0 and total_item_original > 0:
-                                    discount_rate = total_discount / total_item_original
-                                    items_df['Discount Applied'] = items_df['Total Spend Original'] * discount_rate
-                                    items_df['Total Spend'] = items_df['Total Spend Original'] - items_df['Discount Applied']
-                                    st.info(f"💡 Discount of {total_discount:,.0f} {display_unit} successfully allocated across items.")
-                                else:
-                                    pass
+                        if total_discount > 0 and total_item_original > 0:
+                            discount_rate = total_discount / total_item_original
+                            discount_applied = item_totals * discount_rate
+                            items_df['Discount Applied'] = discount_applied
+                            items_df['Total Spend'] = item_totals - discount_applied
+                            st.info(f"💡 Discount of {total_discount:,.0f} {display_unit} successfully allocated across items.")
+                        else:
+                            pass
                                     
                                 
-                                st.subheader("🛒 Detailed Item Breakdown (Category Editable)")
-                                
-                                edited_df = st.data_editor(
-                                    items_df.drop(columns=['Total Spend Original', 'Discount Applied', 'Total Spend']), 
-                                    column_config={
-                                        "AI Category": st.column_config.SelectboxColumn(
-                                            "Final Category",
-                                            help="Select the correct sub-category for this item.",
-                                            width="medium",
-                                            options=ALL_CATEGORIES,
-                                            required=True,
-                                        ),
-                                    },
-                                    disabled=['Item Name', 'Unit Price', 'Quantity'], 
-                                    hide_index=True,
-                                    use_container_width=True
-                                )
-                                
-                                edited_df['Total Spend'] = items_df['Total Spend']
-                                edited_df['Total Spend Numeric'] = pd.to_numeric(edited_df['Total Spend'], errors='coerce').fillna(0)
-                                edited_df['Currency'] = display_unit
-                                
-                                # 📢 Currency Conversion for Accumulation (AI Analysis)
-                                edited_df['Currency'] = display_unit
-                                edited_df['Total Spend Numeric'] = pd.to_numeric(edited_df['Total Spend'], errors='coerce').fillna(0)
-                                edited_df['KRW Total Spend'] = edited_df.apply(
-                                    lambda row: convert_to_krw(row['Total Spend Numeric'], row['Currency'], EXCHANGE_RATES), axis=1
-                                )
-                                edited_df = edited_df.drop(columns=['Total Spend Numeric'])
+                        render_item_review(items_df, display_unit, tax_amount, tip_amount, geo_future, {
+                            'id': file_id,
+                            'filename': uploaded_file.name,
+                            'Store': receipt_data.get('store_name', 'N/A'),
+                            'Date': final_date,
+                            'Location': final_location,
+                            'Original_Total': total_amount,
+                        })
 
-                                krw_tax_total = convert_to_krw(tax_amount, display_unit, EXCHANGE_RATES) 
-                                krw_tip_total = convert_to_krw(tip_amount, display_unit, EXCHANGE_RATES)
-                                
-                                lat, lon = geocode_address(final_location)
-                                
-                                # ** Accumulate Data: Store the edited DataFrame **
-                                st.session_state.all_receipts_items.append(edited_df)
-                                
-                                final_total_krw = edited_df['KRW Total Spend'].sum() + krw_tip_total
-                                
-                                st.session_state.all_receipts_summary.append({
-                                    'id': file_id, 
-                                    'filename': uploaded_file.name,
-                                    'Store': receipt_data.get('store_name', 'N/A'),
-                                    'Total': final_total_krw, 
-                                    'Tax_KRW': krw_tax_total, 
-                                    'Tip_KRW': krw_tip_total, 
-                                    'Currency': 'KRW', 
-                                    'Date': final_date, 
-                                    'Location': final_location, 
-                                    'Original_Total': total_amount, 
-                                    'Original_Currency': display_unit,
-                                    'latitude': lat,
-                                    'longitude': lon
-                                })
-
-                                st.success(f"🎉 Data from {uploaded_file.name} successfully added (Converted to KRW)!")
-
-                            else:
-                                st.warning("Item list could not be found in the analysis result.")
-
-                        except json.JSONDecodeError:
-                            st.error("❌ Gemini analysis result is not a valid JSON format. (JSON parsing error)")
-                        except Exception as e:
-                            st.error(f"Unexpected error occurred during data processing: {e}")
                     else:
-                        st.error("Analysis failed to complete. Please try again.")
+                        st.warning("Item list could not be found in the analysis result.")
+
+                except json.JSONDecodeError:
+                    st.session_state.receipt_results.pop(file_id, None)
+                    st.error("❌ Gemini analysis result is not a valid JSON format. (JSON parsing error)")
+                except Exception as e:
+                    st.error(f"Unexpected error occurred during data processing: {e}")
 
     st.markdown("---")
     
@@ -861,7 +1310,7 @@ with tab1:
                 
                 # 2. Prepare Summary Data
                 manual_summary = {
-                    'id': f"manual-{pd.Timestamp.now().timestamp()}", 
+                    'id': f"manual-{time.time_ns()}", 
                     'filename': 'Manual Entry',
                     'Store': manual_store if manual_store else 'Manual Entry',
                     'Total': krw_total, 
@@ -877,7 +1326,7 @@ with tab1:
                 }
                 
                 # 3. Accumulate Data
-                st.session_state.all_receipts_items.append(manual_df)
+                st.session_state.all_receipts_items.append(optimize_df(manual_df))
                 st.session_state.all_receipts_summary.append(manual_summary)
                 
                 if manual_currency != 'KRW':
@@ -896,388 +1345,386 @@ with tab1:
     # --- 5. Cumulative Data Analysis Section (ALL ANALYSIS IS KRW BASED) ---
     # ----------------------------------------------------------------------
 
-    if st.session_state.all_receipts_items:
-        st.markdown("---")
-        st.title("📚 Cumulative Spending Analysis Report")
+    @st.fragment
+    def render_cumulative_analysis():
+        """Cumulative report; runs as a fragment so its own widgets rerun only this section."""
+        if st.session_state.all_receipts_items:
+            st.markdown("---")
+            st.title("📚 Cumulative Spending Analysis Report")
         
-        all_items_df_numeric = pd.concat(st.session_state.all_receipts_items, ignore_index=True)
+            all_items_df_numeric = get_all_items_df()
         
-        if 'KRW Total Spend' not in all_items_df_numeric.columns:
-             st.warning("Old data structure detected. Recalculating KRW totals...")
-             all_items_df_numeric['KRW Total Spend'] = all_items_df_numeric.apply(
-                 lambda row: convert_to_krw(row['Total Spend'], row['Currency'], EXCHANGE_RATES), axis=1
-             )
+            if 'KRW Total Spend' not in all_items_df_numeric.columns:
+                 st.warning("Old data structure detected. Recalculating KRW totals...")
+                 all_items_df_numeric['KRW Total Spend'] = vec_to_krw(all_items_df_numeric['Total Spend'], all_items_df_numeric['Currency'], EXCHANGE_RATES)
 
-        display_currency_label = 'KRW'
+            display_currency_label = 'KRW'
 
 
-        # A. Display Accumulated Receipts Summary Table (Translated/Modified)
-        st.subheader(f"Total {len(st.session_state.all_receipts_summary)} Receipts Logged (Summary)")
-        summary_df = pd.DataFrame(st.session_state.all_receipts_summary)
+            # A. Display Accumulated Receipts Summary Table (Translated/Modified)
+            st.subheader(f"Total {len(st.session_state.all_receipts_summary)} Receipts Logged (Summary)")
+            summary_df = get_summary_df()
         
-        if 'Original_Total' not in summary_df.columns:
-            summary_df['Original_Total'] = summary_df['Total'] 
-        if 'Original_Currency' not in summary_df.columns:
-            summary_df['Original_Currency'] = 'KRW' 
-        if 'Tax_KRW' not in summary_df.columns:
-            summary_df['Tax_KRW'] = 0.0
-        if 'Tip_KRW' not in summary_df.columns:
-            summary_df['Tip_KRW'] = 0.0
-        if 'Location' not in summary_df.columns:
-            summary_df['Location'] = 'N/A'
-        if 'latitude' not in summary_df.columns:
-            summary_df['latitude'] = 37.5665
-        if 'longitude' not in summary_df.columns:
-            summary_df['longitude'] = 126.9780
-            
-        def format_amount_paid(row):
-            krw_amount = f"{row['Total']:,.0f} KRW"
-            
-            if row['Original_Currency'] != 'KRW':
-                original_amount = f"{row['Original_Total']:,.2f} {row['Original_Currency']}"
-                return f"{original_amount} / {krw_amount}"
+            if 'Original_Total' not in summary_df.columns:
+                summary_df['Original_Total'] = summary_df['Total'] 
+            if 'Original_Currency' not in summary_df.columns:
+                summary_df['Original_Currency'] = 'KRW' 
+            if 'Tax_KRW' not in summary_df.columns:
+                summary_df['Tax_KRW'] = 0.0
+            if 'Tip_KRW' not in summary_df.columns:
+                summary_df['Tip_KRW'] = 0.0
+            if 'Location' not in summary_df.columns:
+                summary_df['Location'] = 'N/A'
+            if 'latitude' not in summary_df.columns:
+                summary_df['latitude'] = 37.5665
+            if 'longitude' not in summary_df.columns:
+                summary_df['longitude'] = 126.9780
             
-            return krw_amount
-        
-        summary_df['Amount Paid'] = summary_df.apply(format_amount_paid, axis=1)
+            krw_amount = summary_df['Total'].map('{:,.0f} KRW'.format)
+            original_amount = summary_df['Original_Total'].map('{:,.2f}'.format) + ' ' + summary_df['Original_Currency'].astype(str)
+            summary_df['Amount Paid'] = krw_amount.where(summary_df['Original_Currency'] == 'KRW', original_amount + ' / ' + krw_amount)
 
         
-        summary_df = summary_df.drop(columns=['id'])
-        summary_df_display = summary_df[['Date', 'Store', 'Location', 'Amount Paid', 'Tax_KRW', 'Tip_KRW', 'filename']] 
-        summary_df_display.columns = ['Date', 'Store', 'Location', 'Amount Paid', 'Tax (KRW)', 'Tip (KRW)', 'Source'] 
-
-        st.dataframe(
-            summary_df_display, 
-            use_container_width=True, 
-            hide_index=True,
-            column_config={
-                "Tax (KRW)": st.column_config.NumberColumn(
-                    "Tax (KRW)", 
-                    format="%.0f KRW" 
-                ),
-                "Tip (KRW)": st.column_config.NumberColumn(
-                    "Tip (KRW)", 
-                    format="%.0f KRW" 
-                ),
-            }
-        )
+            summary_df = summary_df.drop(columns=['id'])
+            summary_df_display = summary_df[['Date', 'Store', 'Location', 'Amount Paid', 'Tax_KRW', 'Tip_KRW', 'filename']] 
+            summary_df_display.columns = ['Date', 'Store', 'Location', 'Amount Paid', 'Tax (KRW)', 'Tip (KRW)', 'Source'] 
+
+            st.dataframe(
+                summary_df_display, 
+                use_container_width=True, 
+                hide_index=True,
+                column_config={
+                    "Tax (KRW)": st.column_config.NumberColumn(
+                        "Tax (KRW)", 
+                        format="%.0f KRW" 
+                    ),
+                    "Tip (KRW)": st.column_config.NumberColumn(
+                        "Tip (KRW)", 
+                        format="%.0f KRW" 
+                    ),
+                }
+            )
         
-        st.markdown("---")
+            st.markdown("---")
         
-        # 📢 [MODIFIED] Spending Trend and Map Visualization in Parallel
-        col_trend, col_map = st.columns(2)
+            # 📢 [MODIFIED] Spending Trend and Map Visualization in Parallel
+            col_trend, col_map = st.columns(2)
         
-        with col_trend:
-            # --- Spending Trend Over Time Chart (KRW based) ---
-            st.subheader("📈 Spending Trend Over Time")
+            with col_trend:
+                # --- Spending Trend Over Time Chart (KRW based) ---
+                st.subheader("📈 Spending Trend Over Time")
             
-            summary_df_raw = pd.DataFrame(st.session_state.all_receipts_summary)
+                summary_df_raw = get_summary_df()
             
-            if not summary_df_raw.empty:
+                if not summary_df_raw.empty:
                 
-                summary_df_raw['Date'] = pd.to_datetime(summary_df_raw['Date'], errors='coerce')
-                summary_df_raw['Total'] = pd.to_numeric(summary_df_raw['Total'], errors='coerce') 
+                    summary_df_raw['Date'] = pd.to_datetime(summary_df_raw['Date'], errors='coerce')
+                    summary_df_raw['Total'] = pd.to_numeric(summary_df_raw['Total'], errors='coerce') 
                 
-                daily_spending = summary_df_raw.dropna(subset=['Date', 'Total'])
-                daily_spending = daily_spending.groupby('Date')['Total'].sum().reset_index()
-                daily_spending.columns = ['Date', 'Daily Total Spend']
+                    daily_spending = summary_df_raw.dropna(subset=['Date', 'Total'])
+                    daily_spending = daily_spending.groupby('Date')['Total'].sum().reset_index()
+                    daily_spending.columns = ['Date', 'Daily Total Spend']
                 
-                if not daily_spending.empty:
-                    fig_trend = px.line(
-                        daily_spending, x='Date', y='Daily Total Spend',
-                        title=f'Daily Spending Trend (Unit: {display_currency_label})',
-                        labels={'Daily Total Spend': f'Total Spend ({display_currency_label})', 'Date': 'Date'},
-                        markers=True
-                    )
-                    fig_trend.update_layout(margin=dict(t=30, b=0, l=0, r=0), height=400)
-                    st.plotly_chart(fig_trend, use_container_width=True)
-                else:
-                    st.warning("Date data is not available or not properly formatted to show the trend chart.")
+                    if not daily_spending.empty:
+                        import plotly.express as px  # 📢 deferred: only chart renders pay the plotly import
+                        fig_trend = px.line(
+                            daily_spending, x='Date', y='Daily Total Spend',
+                            title=f'Daily Spending Trend (Unit: {display_currency_label})',
+                            labels={'Daily Total Spend': f'Total Spend ({display_currency_label})', 'Date': 'Date'},
+                            markers=True
+                        )
+                        fig_trend.update_layout(margin=dict(t=30, b=0, l=0, r=0), height=400)
+                        st.plotly_chart(fig_trend, use_container_width=True)
+                    else:
+                        st.warning("Date data is not available or not properly formatted to show the trend chart.")
         
-        with col_map:
-            # --- Spending Map Visualization Section ---
-            st.subheader("📍 Spending Map Visualization")
+            with col_map:
+                # --- Spending Map Visualization Section ---
+                st.subheader("📍 Spending Map Visualization")
             
-            map_df = summary_df.copy()
-            map_df.columns = [col.replace('latitude', 'lat').replace('longitude', 'lon') for col in map_df.columns]
+                map_df = summary_df.copy()
+                map_df.columns = [col.replace('latitude', 'lat').replace('longitude', 'lon') for col in map_df.columns]
     
-            if not map_df.empty and 'lat' in map_df.columns and 'lon' in map_df.columns:
+                if not map_df.empty and 'lat' in map_df.columns and 'lon' in map_df.columns:
                 
-                map_data = map_df[map_df['Total'] > 0].dropna(subset=['lat', 'lon'])
+                    map_data = map_df[map_df['Total'] > 0].dropna(subset=['lat', 'lon'])
                 
-                if not map_data.empty:
-                    st.map(
-                        map_data, 
-                        latitude='lat', 
-                        longitude='lon', 
-                        color='#ff6347', 
-                        zoom=11, 
-                        use_container_width=True
-                    )
+                    if not map_data.empty:
+                        st.map(
+                            map_data, 
+                            latitude='lat', 
+                            longitude='lon', 
+                            color='#ff6347', 
+                            zoom=11, 
+                            use_container_width=True
+                        )
                 
+                    else:
+                        st.warning("No valid coordinate data found to display the map.")
                 else:
-                    st.warning("No valid coordinate data found to display the map.")
-            else:
-                st.warning("Location data or coordinate columns are not available.")
+                    st.warning("Location data or coordinate columns are not available.")
 
 
-        st.markdown("---")
+            st.markdown("---")
         
-        st.subheader("🛒 Integrated Detail Items") 
+            st.subheader("🛒 Integrated Detail Items") 
         
-        all_items_df_display = all_items_df_numeric.copy()
+            all_items_df_display = all_items_df_numeric[['Item Name', 'AI Category']].copy()
         
-        all_items_df_display['Original Total'] = all_items_df_display.apply(
-            lambda row: f"{row['Total Spend']:,.2f} {row['Currency']}", axis=1
-        )
-        all_items_df_display['KRW Equivalent'] = all_items_df_display['KRW Total Spend'].apply(
-            lambda x: f"{x:,.0f} KRW"
-        )
+            all_items_df_display['Original Total'] = (
+                all_items_df_numeric['Total Spend'].map('{:,.2f}'.format) + ' ' + all_items_df_numeric['Currency'].astype(str)
+            )
+            all_items_df_display['KRW Equivalent'] = all_items_df_numeric['KRW Total Spend'].map('{:,.0f} KRW'.format)
         
-        st.dataframe(
-            all_items_df_display[['Item Name', 'Original Total', 'KRW Equivalent', 'AI Category']], 
-            use_container_width=True, 
-            hide_index=True
-        )
+            st.dataframe(
+                all_items_df_display[['Item Name', 'Original Total', 'KRW Equivalent', 'AI Category']], 
+                use_container_width=True, 
+                hide_index=True
+            )
 
-        # 2. Aggregate spending by category and visualize (KRW based)
-        category_summary = all_items_df_numeric.groupby('AI Category')['KRW Total Spend'].sum().reset_index()
-        category_summary.columns = ['Category', 'Amount']
+            # 2. Aggregate spending by category and visualize (KRW based)
+            category_amounts = dict(sorted(get_category_totals().items()))
         
-        total_tax_krw = summary_df['Tax_KRW'].sum()
-        total_tip_krw = summary_df['Tip_KRW'].sum()
+            total_tax_krw = summary_df['Tax_KRW'].sum()
+            total_tip_krw = summary_df['Tip_KRW'].sum()
         
-        if total_tax_krw > 0:
-            category_summary.loc[len(category_summary)] = ['Tax/VAT', total_tax_krw]
-        if total_tip_krw > 0:
-            category_summary.loc[len(category_summary)] = ['Tip', total_tip_krw]
+            if total_tax_krw > 0:
+                category_amounts['Tax/VAT'] = total_tax_krw
+            if total_tip_krw > 0:
+                category_amounts['Tip'] = total_tip_krw
+            category_series = pd.Series(category_amounts, name='Amount', dtype='float64').rename_axis('Category')
+            category_summary = category_series.reset_index()
             
-        # --- Display Summary Table ---
-        st.subheader("💰 Spending Summary by Category (Items + Tax + Tip)") 
-        category_summary_display = category_summary.copy()
-        category_summary_display['Amount'] = category_summary_display['Amount'].apply(lambda x: f"{x:,.0f} {display_currency_label}")
-        st.dataframe(category_summary_display, use_container_width=True, hide_index=True)
-
-        # --- Visualization (Charts use KRW Amount) ---
-        col_chart, col_pie = st.columns(2)
+            # --- Display Summary Table ---
+            st.subheader("💰 Spending Summary by Category (Items + Tax + Tip)") 
+            category_summary_display = category_summary.copy()
+            category_summary_display['Amount'] = category_summary_display['Amount'].apply(lambda x: f"{x:,.0f} {display_currency_label}")
+            st.dataframe(category_summary_display, use_container_width=True, hide_index=True)
+
+            # --- Visualization (Charts use KRW Amount) ---
+            col_chart, col_pie = st.columns(2)
         
-        with col_chart:
-            st.subheader(f"Bar Chart Visualization (Unit: {display_currency_label})")
-            st.bar_chart(category_summary.set_index('Category'))
+            with col_chart:
+                st.subheader(f"Bar Chart Visualization (Unit: {display_currency_label})")
+                st.bar_chart(category_series)
             
-        with col_pie:
-            st.subheader(f"Pie Chart Visualization (Unit: {display_currency_label})")
-            chart_data = category_summary[category_summary['Amount'] > 0] 
+            with col_pie:
+                st.subheader(f"Pie Chart Visualization (Unit: {display_currency_label})")
+                chart_data = category_summary[category_summary['Amount'] > 0] 
             
-            if not chart_data.empty:
-                fig = px.pie(
-                    chart_data, values='Amount', names='Category', 
-                    title=f'Spending Distribution by Category (Unit: {display_currency_label})', hole=.3, 
-                )
-                fig.update_traces(textposition='inside', textinfo='percent+label')
-                fig.update_layout(margin=dict(t=30, b=0, l=0, r=0), height=400)
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.warning("No spending data found to generate the pie chart.")
+                if not chart_data.empty:
+                    def build_category_pie():
+                        import plotly.express as px
+                        fig = px.pie(
+                            chart_data, values='Amount', names='Category', 
+                            title=f'Spending Distribution by Category (Unit: {display_currency_label})', hole=.3, 
+                        )
+                        fig.update_traces(textposition='inside', textinfo='percent+label')
+                        fig.update_layout(margin=dict(t=30, b=0, l=0, r=0), height=400)
+                        return fig
+                    
+                    st.plotly_chart(ledger_memo('category_pie_cache', build_category_pie), use_container_width=True)
+                else:
+                    st.warning("No spending data found to generate the pie chart.")
         
-        # 4. Reset and Download Buttons
-        st.markdown("---")
-        @st.cache_data
-        def convert_df_to_csv(df):
-            return df.to_csv(index=False, encoding='utf-8-sig')
-
-        csv = convert_df_to_csv(all_items_df_numeric) 
-        st.download_button(
-            label="⬇️ Download Full Cumulative Ledger Data (CSV)",
-            data=csv,
-            file_name=f"record_{pd.Timestamp.now().strftime('%Y%m%d')}.csv",
-            mime='text/csv',
-        )
+            # 4. Reset and Download Buttons
+            st.markdown("---")
+            csv = ledger_memo('ledger_csv_cache', lambda: convert_df_to_csv(all_items_df_numeric))
+            st.download_button(
+                label="⬇️ Download Full Cumulative Ledger Data (CSV)",
+                data=csv,
+                file_name=f"record_{datetime.date.today().strftime('%Y%m%d')}.csv",
+                mime='text/csv',
+            )
+
+            if st.button("🧹 Reset Record", help="Clears all accumulated receipt analysis records in the app."):
+                st.session_state.all_receipts_items = []
+                st.session_state.all_receipts_summary = []
+                st.session_state.chat_history = [] 
+                for memo_key in ('all_items_df_cache', 'report_items_df_cache', 'category_totals_cache', 'psychological_summary_cache', 'chat_items_text_cache', 'ledger_csv_cache', 'category_pie_cache', 'summary_df_cache', 'summary_id_index'):
+                    st.session_state.pop(memo_key, None)
+                st.rerun() 
 
-        if st.button("🧹 Reset Record", help="Clears all accumulated receipt analysis records in the app."):
-            st.session_state.all_receipts_items = []
-            st.session_state.all_receipts_summary = []
-            st.session_state.chat_history = [] 
-            st.rerun() 
+    render_cumulative_analysis()
 
 # ======================================================================
 # 		 	TAB 2: FINANCIAL EXPERT CHAT (MODIFIED)
 # ======================================================================
 with tab2:
-    st.header("💬 Financial Expert Chat")
+    @st.fragment
+    def render_chat_tab():
+        """Chat tab; runs as a fragment so sending a message reruns only the chat, not the analysis tab."""
+        st.header("💬 Financial Expert Chat")
     
-    if not st.session_state.all_receipts_items:
-        st.warning("Please analyze at least one receipt or load a CSV in the 'Analysis & Tracking' tab before starting a consultation.")
-    else:
-        # --- Chat Data Preparation (Calculation logic remains English) ---
-        current_data_hash = hash(tuple(item['id'] for item in st.session_state.all_receipts_summary))
+        if not st.session_state.all_receipts_items:
+            st.warning("Please analyze at least one receipt or load a CSV in the 'Analysis & Tracking' tab before starting a consultation.")
+        else:
+            # --- Chat Data Preparation (Calculation logic remains English) ---
+            current_data_hash = hash(tuple(item['id'] for item in st.session_state.all_receipts_summary))
         
-        if 'last_data_hash' not in st.session_state or st.session_state.last_data_hash != current_data_hash:
-            st.session_state.chat_history = []
-            st.session_state.last_data_hash = current_data_hash
-            st.info("📊 New spending data detected. Chat history is being reset for fresh analysis.")
+            if 'last_data_hash' not in st.session_state or st.session_state.last_data_hash != current_data_hash:
+                st.session_state.chat_history = []
+                st.session_state.last_data_hash = current_data_hash
+                st.info("📊 New spending data detected. Chat history is being reset for fresh analysis.")
         
-        all_items_df = pd.concat(st.session_state.all_receipts_items, ignore_index=True)
+            all_items_df = get_all_items_df()
         
-        if 'KRW Total Spend' not in all_items_df.columns:
-             all_items_df['KRW Total Spend'] = all_items_df.apply(
-                 lambda row: convert_to_krw(row['Total Spend'], row['Currency'], EXCHANGE_RATES), axis=1
-             )
-
-        all_items_df['Psychological Category'] = all_items_df['AI Category'].apply(get_psychological_category)
-        psychological_summary = all_items_df.groupby('Psychological Category')['KRW Total Spend'].sum().reset_index()
-        psychological_summary.columns = ['Category', 'KRW Total Spend']
-
-        summary_df_for_chat = pd.DataFrame(st.session_state.all_receipts_summary)
-        tax_tip_only_total = 0.0
-        if 'Tip_KRW' in summary_df_for_chat.columns:
-            tax_tip_only_total += summary_df_for_chat['Tip_KRW'].sum()
+            if 'KRW Total Spend' not in all_items_df.columns:
+                 all_items_df['KRW Total Spend'] = vec_to_krw(all_items_df['Total Spend'], all_items_df['Currency'], EXCHANGE_RATES)
+
+            all_items_df['Psychological Category'] = map_psychological_category(all_items_df['AI Category'])
+            psychological_summary = ledger_memo(
+                'psychological_summary_cache',
+                lambda: all_items_df.groupby('Psychological Category')['KRW Total Spend'].sum().reset_index()
+            ).copy()
+            psychological_summary.columns = ['Category', 'KRW Total Spend']
+
+            summary_df_for_chat = get_summary_df()
+            tax_tip_only_total = 0.0
+            if 'Tip_KRW' in summary_df_for_chat.columns:
+                tax_tip_only_total += summary_df_for_chat['Tip_KRW'].sum()
         
-        if tax_tip_only_total > 0:
-            fixed_cost_index = psychological_summary[psychological_summary['Category'] == PSYCHOLOGICAL_CATEGORIES[3]].index
-            if not fixed_cost_index.empty:
-                psychological_summary.loc[fixed_cost_index[0], 'KRW Total Spend'] += tax_tip_only_total 
-            else:
-                new_row = pd.DataFrame([{'Category': PSYCHOLOGICAL_CATEGORIES[3], 'KRW Total Spend': tax_tip_only_total}])
-                psychological_summary = pd.concat([psychological_summary, new_row], ignore_index=True)
+            if tax_tip_only_total > 0:
+                fixed_cost_index = psychological_summary[psychological_summary['Category'] == PSYCHOLOGICAL_CATEGORIES[3]].index
+                if not fixed_cost_index.empty:
+                    psychological_summary.loc[fixed_cost_index[0], 'KRW Total Spend'] += tax_tip_only_total 
+                else:
+                    new_row = pd.DataFrame([{'Category': PSYCHOLOGICAL_CATEGORIES[3], 'KRW Total Spend': tax_tip_only_total}])
+                    psychological_summary = pd.concat([psychological_summary, new_row], ignore_index=True)
 
-        total_spent = psychological_summary['KRW Total Spend'].sum()
+            total_spent = psychological_summary['KRW Total Spend'].sum()
         
-        impulse_spending = psychological_summary.loc[psychological_summary['Category'] == PSYCHOLOGICAL_CATEGORIES[2], 'KRW Total Spend'].sum()
+            impulse_spending = psychological_summary.loc[psychological_summary['Category'] == PSYCHOLOGICAL_CATEGORIES[2], 'KRW Total Spend'].sum()
         
-        total_transactions = len(all_items_df)
-        impulse_transactions = len(all_items_df[all_items_df['Psychological Category'] == PSYCHOLOGICAL_CATEGORIES[2]])
+            total_transactions = len(all_items_df)
+            impulse_transactions = len(all_items_df[all_items_df['Psychological Category'] == PSYCHOLOGICAL_CATEGORIES[2]])
         
-        if total_spent > 0 and total_transactions > 0:
-            amount_ratio = impulse_spending / total_spent
-            frequency_ratio_factor = np.sqrt(impulse_transactions / total_transactions)
-            impulse_index = amount_ratio * frequency_ratio_factor
-        else:
-            impulse_index = 0.0
+            if total_spent > 0 and total_transactions > 0:
+                amount_ratio = impulse_spending / total_spent
+                frequency_ratio_factor = np.sqrt(impulse_transactions / total_transactions)
+                impulse_index = amount_ratio * frequency_ratio_factor
+            else:
+                impulse_index = 0.0
         
-        psychological_summary_text = psychological_summary.to_string(index=False)
+            psychological_summary_text = psychological_summary.to_string(index=False)
         
-        highest_impulse_category = ""
-        highest_impulse_amount = 0
+            highest_impulse_category = ""
+            highest_impulse_amount = 0
         
-        # 📢 [FIX] Renamed 'all_' to 'all_items_df'
-        impulse_items_df = all_items_df[all_items_df['Psychological Category'] == PSYCHOLOGICAL_CATEGORIES[2]]
-        if not impulse_items_df.empty:
-            impulse_category_sum = impulse_items_df.groupby('AI Category')['KRW Total Spend'].sum()
-            if not impulse_category_sum.empty:
-                highest_impulse_category = impulse_category_sum.idxmax()
-                highest_impulse_amount = impulse_category_sum.max()
-
-        # 📢 [NEW] Basic Economic Profile Calculation
-        avg_transaction_value = all_items_df['KRW Total Spend'].mean() if total_transactions > 0 else 0
-        top_merchant = all_items_df['Store'].mode()[0] if 'Store' in all_items_df.columns and not all_items_df['Store'].empty else "N/A"
+            # 📢 [FIX] Renamed 'all_' to 'all_items_df'
+            impulse_items_df = all_items_df[all_items_df['Psychological Category'] == PSYCHOLOGICAL_CATEGORIES[2]]
+            if not impulse_items_df.empty:
+                impulse_category_sum = impulse_items_df.groupby('AI Category', observed=True, sort=False)['KRW Total Spend'].sum()
+                if not impulse_category_sum.empty:
+                    highest_impulse_category = impulse_category_sum.idxmax()
+                    highest_impulse_amount = impulse_category_sum.max()
+
+            # 📢 [NEW] Basic Economic Profile Calculation
+            avg_transaction_value = all_items_df['KRW Total Spend'].mean() if total_transactions > 0 else 0
+            top_merchant = all_items_df['Store'].mode()[0] if 'Store' in all_items_df.columns and not all_items_df['Store'].empty else "N/A"
         
-        # Convert total spending to float for std calculation
-        summary_df_raw = pd.DataFrame(st.session_state.all_receipts_summary)
-        summary_df_raw['Date'] = pd.to_datetime(summary_df_raw['Date'], errors='coerce')
-        daily_spending = summary_df_raw.dropna(subset=['Date', 'Total']).groupby(pd.Grouper(key='Date', freq='D'))['Total'].sum()
-        spending_std_dev = daily_spending.std() if len(daily_spending) > 1 else 0
+            # Convert total spending to float for std calculation
+            summary_df_raw = get_summary_df()
+            summary_df_raw['Date'] = pd.to_datetime(summary_df_raw['Date'], errors='coerce')
+            daily_spending = summary_df_raw.dropna(subset=['Date', 'Total']).groupby(pd.Grouper(key='Date', freq='D'))['Total'].sum()
+            spending_std_dev = daily_spending.std() if len(daily_spending) > 1 else 0
         
-        # Prepare economic profile text
-        economic_profile_text = (
-            f"Average Transaction Value: {avg_transaction_value:,.0f} KRW. "
-            f"Top Merchant by Volume: {top_merchant}. "
-            f"Daily Spending Variability (Std Dev): {spending_std_dev:,.0f} KRW."
-        )
+            # Prepare economic profile text
+            economic_profile_text = (
+                f"Average Transaction Value: {avg_transaction_value:,.0f} KRW. "
+                f"Top Merchant by Volume: {top_merchant}. "
+                f"Daily Spending Variability (Std Dev): {spending_std_dev:,.0f} KRW."
+            )
         
         
-        detailed_items_for_chat = all_items_df[['Psychological Category', 'Item Name', 'KRW Total Spend']]
-        items_text_for_chat = detailed_items_for_chat.to_string(index=False)
+            items_text_for_chat = ledger_memo(
+                'chat_items_text_cache',
+                lambda: all_items_df[['Psychological Category', 'Item Name', 'KRW Total Spend']].to_string(index=False)
+            )
         
-        # MODIFIED SYSTEM INSTRUCTION (CRITICAL)
-        # 📢 Added Economic Profile to System Instruction
-        system_instruction = f"""
-        You are a supportive, friendly, and highly knowledgeable Financial Psychologist and Economic Advisor. Your analysis must cover both psychological tendencies and objective economic characteristics.
+            # MODIFIED SYSTEM INSTRUCTION (CRITICAL)
+            # 📢 Added Economic Profile to System Instruction
+            system_instruction = f"""
+            You are a supportive, friendly, and highly knowledgeable Financial Psychologist and Economic Advisor. Your analysis must cover both psychological tendencies and objective economic characteristics.
         
-        --- User's Financial Profile ---
-        - **Total Spent**: {total_spent:,.0f} KRW
-        - **Impulse Index**: {impulse_index:.2f} (Target: < 0.15)
-        - **Highest Impulse Category**: '{highest_impulse_category}'
-        - **Psychological Breakdown**: {psychological_summary_text}
+            --- User's Financial Profile ---
+            - **Total Spent**: {total_spent:,.0f} KRW
+            - **Impulse Index**: {impulse_index:.2f} (Target: < 0.15)
+            - **Highest Impulse Category**: '{highest_impulse_category}'
+            - **Psychological Breakdown**: {psychological_summary_text}
         
-        --- Objective Economic Metrics ---
-        {economic_profile_text}
+            --- Objective Economic Metrics ---
+            {economic_profile_text}
         
-        **CRITICAL INSTRUCTION:** Your responses must start by integrating the **Impulse Index** and at least one **Objective Economic Metric** (e.g., Average Transaction Value or Spending Variability) to provide a holistic view of the user's spending habits.
+            **CRITICAL INSTRUCTION:** Your responses must start by integrating the **Impulse Index** and at least one **Objective Economic Metric** (e.g., Average Transaction Value or Spending Variability) to provide a holistic view of the user's spending habits.
         
-        When the user asks for advice or interpretation, provide actionable and psychological tips. Propose 2-3 specific, actionable, low-cost alternatives to reduce cost by at least 30% for high-impulse spending.
-        """
+            When the user asks for advice or interpretation, provide actionable and psychological tips. Propose 2-3 specific, actionable, low-cost alternatives to reduce cost by at least 30% for high-impulse spending.
+            """
 
-        # 💡 Initial Message (Translated)
-        if not st.session_state.chat_history or (len(st.session_state.chat_history) == 1 and st.session_state.chat_history[0]["content"].startswith("Hello! I am your AI Financial Psychology Expert")):
-              st.session_state.chat_history = []
+            # 💡 Initial Message (Translated)
+            if not st.session_state.chat_history or (len(st.session_state.chat_history) == 1 and st.session_state.chat_history[0]["content"].startswith("Hello! I am your AI Financial Psychology Expert")):
+                  st.session_state.chat_history = []
               
-              if highest_impulse_category:
-                  impulse_info = f"Your highest impulse spending is in the **{highest_impulse_category}** category, totaling **{highest_impulse_amount:,.0f} KRW**."
-              else:
-                  impulse_info = "Impulse spending items have not been clearly analyzed yet."
+                  if highest_impulse_category:
+                      impulse_info = f"Your highest impulse spending is in the **{highest_impulse_category}** category, totaling **{highest_impulse_amount:,.0f} KRW**."
+                  else:
+                      impulse_info = "Impulse spending items have not been clearly analyzed yet."
 
-              initial_message = f"""
-              Hello! I am your AI Financial Psychology Expert, here to analyze your spending patterns and economic characteristics. 🧠
+                  initial_message = f"""
+                  Hello! I am your AI Financial Psychology Expert, here to analyze your spending patterns and economic characteristics. 🧠
               
-              --- Your Profile Summary ---
-              * **Total Spent**: {total_spent:,.0f} KRW
-              * **Calculated Impulse Index**: {impulse_index:.2f}
-              * **Average Transaction Value**: {avg_transaction_value:,.0f} KRW
-              * {impulse_info}
-
-              How can I help you improve your financial health and spending efficiency? You can ask:
-
-              * **"Analyze my spending"**
-              * **"Any advice for saving tips?**
-              * **"What do my index and spending variability mean for my budget?"**
-              * **"Could you recommend low-cost alternatives for my biggest impulse item?"**
-              * "How can I better align my spending with my **'Investment / Asset'** goals?"
-              """
-              st.session_state.chat_history.append({"role": "assistant", "content": initial_message})
-
-        # --- [수정] 대화 기록을 컨테이너로 감싸서 입력 바가 고정되도록 합니다. ---
-        chat_history_container = st.container() 
+                  --- Your Profile Summary ---
+                  * **Total Spent**: {total_spent:,.0f} KRW
+                  * **Calculated Impulse Index**: {impulse_index:.2f}
+                  * **Average Transaction Value**: {avg_transaction_value:,.0f} KRW
+                  * {impulse_info}
+
+                  How can I help you improve your financial health and spending efficiency? You can ask:
+
+                  * **"Analyze my spending"**
+                  * **"Any advice for saving tips?**
+                  * **"What do my index and spending variability mean for my budget?"**
+                  * **"Could you recommend low-cost alternatives for my biggest impulse item?"**
+                  * "How can I better align my spending with my **'Investment / Asset'** goals?"
+                  """
+                  st.session_state.chat_history.append({"role": "assistant", "content": initial_message})
+
+            # --- [수정] 대화 기록을 컨테이너로 감싸서 입력 바가 고정되도록 합니다. ---
+            chat_history_container = st.container() 
         
-        with chat_history_container: # 대화 기록을 컨테이너 안에 표시
-            for message in st.session_state.chat_history:
-                with st.chat_message(message["role"]):
-                    st.markdown(message["content"])
+            with chat_history_container: # 대화 기록을 컨테이너 안에 표시
+                for message in st.session_state.chat_history:
+                    with st.chat_message(message["role"]):
+                        st.markdown(message["content"])
 
-        # Process user input (st.chat_input이 이제 컨테이너 아래에 위치하며, Streamlit의 고정 위치 기능을 활용합니다.)
-        if prompt := st.chat_input("Ask for financial advice or review your spending..."):
+            # Process user input (st.chat_input이 이제 컨테이너 아래에 위치하며, Streamlit의 고정 위치 기능을 활용합니다.)
+            if prompt := st.chat_input("Ask for financial advice or review your spending..."):
             
-            st.session_state.chat_history.append({"role": "user", "content": prompt})
-            with st.chat_message("user"):
-                st.markdown(prompt)
+                st.session_state.chat_history.append({"role": "user", "content": prompt})
+                with st.chat_message("user"):
+                    st.markdown(prompt)
 
-            with st.chat_message("assistant"):
-                with st.spinner("Expert is thinking..."):
-                    try:
-                        combined_contents = []
-                        history_items = st.session_state.chat_history 
-                        
-                        for item in history_items:
-                            gemini_role = "user" if item["role"] == "user" else "model" 
-                            
-                            combined_contents.append({
-                                "role": gemini_role, 
-                                "parts": [{"text": item["content"]}]
-                            })
+                with st.chat_message("assistant"):
+                    with st.spinner("Expert is thinking..."):
+                        try:
+                            combined_contents = build_chat_contents(st.session_state.chat_history)
                         
-                        response = client.models.generate_content(
-                            model='gemini-2.5-flash',
-                            contents=combined_contents, 
-                            config=genai.types.GenerateContentConfig(
-                                system_instruction=system_instruction
+                            # Stream the reply so the first tokens render while Gemini is still generating
+                            stream = client.models.generate_content_stream(
+                                model='gemini-2.5-flash',
+                                contents=combined_contents, 
+                                config=genai.types.GenerateContentConfig(
+                                    system_instruction=system_instruction
+                                )
                             )
-                        )
                         
-                        st.markdown(response.text)
-                        st.session_state.chat_history.append({"role": "assistant", "content": response.text})
+                            response_text = st.write_stream(chunk.text for chunk in stream if chunk.text)
+                            st.session_state.chat_history.append({"role": "assistant", "content": response_text})
                         
-                    except Exception as e:
-                        st.error(f"Chatbot API call failed: {e}")
+                        except Exception as e:
+                            st.error(f"Chatbot API call failed: {e}")
+
+    render_chat_tab()
 
 # ======================================================================
 # 		 	TAB 3: PDF REPORT GENERATOR (MODIFIED)
@@ -1295,22 +1742,27 @@ with tab3:
         summary_list = st.session_state.all_receipts_summary
         items_list = st.session_state.all_receipts_items
         
-        items_with_meta = []
-        for item_df, summary in zip(items_list, summary_list):
-            item_df_copy = item_df.copy()
-            
-            if 'Date' not in item_df_copy.columns:
-                item_df_copy['Date'] = summary.get('Date', 'N/A')
-            if 'Store' not in item_df_copy.columns:
-                item_df_copy['Store'] = summary.get('Store', 'N/A')
+        def build_items_with_meta():
+            items_with_meta = []
+            for item_df, summary in zip(items_list, summary_list):
+                item_df_copy = item_df.copy(deep=False)
                 
-            items_with_meta.append(item_df_copy)
+                if 'Date' not in item_df_copy.columns:
+                    item_df_copy['Date'] = summary.get('Date', 'N/A')
+                if 'Store' not in item_df_copy.columns:
+                    item_df_copy['Store'] = summary.get('Store', 'N/A')
+                    
+                items_with_meta.append(item_df_copy)
+            return pd.concat(items_with_meta, ignore_index=True)
             
-        all_items_df = pd.concat(items_with_meta, ignore_index=True)
+        all_items_df = ledger_memo('report_items_df_cache', build_items_with_meta).copy(deep=False)
         
-        all_items_df['Psychological Category'] = all_items_df['AI Category'].apply(get_psychological_category)
+        all_items_df['Psychological Category'] = map_psychological_category(all_items_df['AI Category'])
         
-        psychological_summary_pdf = all_items_df.groupby('Psychological Category')['KRW Total Spend'].sum().reset_index()
+        psychological_summary_pdf = ledger_memo(
+            'psychological_summary_cache',
+            lambda: all_items_df.groupby('Psychological Category')['KRW Total Spend'].sum().reset_index()
+        ).copy()
         psychological_summary_pdf.columns = ['Category', 'Amount (KRW)']
         total_spent = psychological_summary_pdf['Amount (KRW)'].sum()
         
@@ -1328,7 +1780,7 @@ with tab3:
         highest_impulse_category = "N/A"
         impulse_items_df = all_items_df[all_items_df['Psychological Category'] == PSYCHOLOGICAL_CATEGORIES[2]]
         if not impulse_items_df.empty:
-            highest_impulse_category_calc = impulse_items_df.groupby('AI Category')['KRW Total Spend'].sum()
+            highest_impulse_category_calc = impulse_items_df.groupby('AI Category', observed=True, sort=False)['KRW Total Spend'].sum()
             if not highest_impulse_category_calc.empty:
                 highest_impulse_category = highest_impulse_category_calc.idxmax()
         